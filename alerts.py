@@ -0,0 +1,303 @@
+import asyncio
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# Алиасы P2P-котировок для алертов (средняя цена снимка)
+P2P_ALERT_SYMBOLS = {
+    ("bybit_p2p", "buy"): "RUBBUY",
+    ("bybit_p2p", "sell"): "RUBSELL",
+    ("htx_p2p", "buy"): "CNYBUY",
+    ("htx_p2p", "sell"): "CNYSELL",
+}
+
+# Формат команды: /alert BTCUSDT > 70000
+ALERT_PATTERN = re.compile(r"^\s*([A-Za-z0-9]{3,20})\s*(>=|<=|>|<)\s*([0-9]+(?:[.,][0-9]+)?)\s*$")
+
+
+class Alert:
+    __slots__ = ("id", "chat_id", "symbol", "op", "threshold")
+
+    def __init__(self, alert_id: int, chat_id: int, symbol: str, op: str, threshold: float):
+        self.id = alert_id
+        self.chat_id = chat_id
+        self.symbol = symbol
+        self.op = op  # ">" - цена поднялась до уровня, "<" - опустилась до уровня
+        self.threshold = threshold
+
+
+class SymbolIndex:
+    """
+    Отсортированные индексы порогов одного символа.
+
+    Алерты "выше" срабатывают, когда цена >= порога: это префикс списка,
+    отсортированного по возрастанию. Алерты "ниже" срабатывают, когда
+    цена <= порога: это суффикс. Поиск границы - bisect, O(log n + k).
+    """
+
+    def __init__(self):
+        self.above = []  # отсортированные пары (порог, id)
+        self.below = []
+
+    def add(self, alert: Alert):
+        side = self.above if alert.op == ">" else self.below
+        bisect.insort(side, (alert.threshold, alert.id))
+
+    def remove(self, alert: Alert):
+        side = self.above if alert.op == ">" else self.below
+        index = bisect.bisect_left(side, (alert.threshold, alert.id))
+        if index < len(side) and side[index] == (alert.threshold, alert.id):
+            del side[index]
+
+    def pop_crossed(self, price: float):
+        """
+        Удаляет и возвращает id алертов, пороги которых пересечены ценой.
+        """
+        fired = []
+        # (price, inf) больше любой пары с порогом == price
+        cut = bisect.bisect_right(self.above, (price, float("inf")))
+        if cut:
+            fired.extend(alert_id for _, alert_id in self.above[:cut])
+            del self.above[:cut]
+        cut = bisect.bisect_left(self.below, (price, float("-inf")))
+        if cut < len(self.below):
+            fired.extend(alert_id for _, alert_id in self.below[cut:])
+            del self.below[cut:]
+        return fired
+
+    def __len__(self):
+        return len(self.above) + len(self.below)
+
+
+class AlertEngine:
+    """
+    Ценовые алерты пользователей с хранением в SQLite.
+
+    Каждое обновление цены (on_tick) проверяет только индекс своего символа
+    и отправляет уведомления через очередь с ограничением скорости.
+
+    База - источник истины: при шардировании алерты добавляют и удаляют
+    все воркеры, а индексы, проверку и отправку ведет только основной
+    процесс. Он перечитывает базу на каждом цикле проверки, а перед
+    отправкой удаляет алерт из базы и отправляет, только если алерт там
+    еще был (поэтому уведомление не уходит дважды и не уходит после /unalert).
+    """
+
+    def __init__(self, path: str = "alerts.sqlite3", max_per_chat: int = 20, send_rate: float = 20.0):
+        """
+        :param path: Путь к файлу базы данных.
+        :param max_per_chat: Максимальное количество алертов у одного пользователя.
+        :param send_rate: Максимальное количество уведомлений в секунду.
+        """
+        self.path = path
+        self.max_per_chat = max_per_chat
+        self.send_rate = send_rate
+        self._alerts = {}  # id -> Alert
+        self._index = {}  # symbol -> SymbolIndex
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._conn = None
+        self.active = False  # Индексы и отправка работают в этом процессе
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER, symbol TEXT, op TEXT, threshold REAL, created REAL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _read(self):
+        return self._connect().execute("SELECT id, chat_id, symbol, op, threshold FROM alerts").fetchall()
+
+    def load(self, rows=None):
+        """
+        Перестраивает индексы по алертам из базы.
+
+        :param rows: Строки (id, chat_id, symbol, op, threshold); по умолчанию читаются из базы.
+        """
+        rows = self._read() if rows is None else rows
+        self._alerts = {}
+        self._index = {}
+        for alert_id, chat_id, symbol, op, threshold in rows:
+            self._insert(Alert(alert_id, chat_id, symbol, op, threshold))
+
+    def _insert(self, alert: Alert):
+        self._alerts[alert.id] = alert
+        self._index.setdefault(alert.symbol, SymbolIndex()).add(alert)
+
+    def symbols(self):
+        """
+        Символы, по которым есть активные алерты.
+        """
+        return [symbol for symbol, index in self._index.items() if len(index)]
+
+    def list_for_chat(self, chat_id: int):
+        rows = self._connect().execute(
+            "SELECT id, chat_id, symbol, op, threshold FROM alerts WHERE chat_id = ? ORDER BY id", (chat_id,))
+        return [Alert(*row) for row in rows]
+
+    def add(self, chat_id: int, symbol: str, op: str, threshold: float):
+        """
+        Добавляет алерт.
+
+        :param op: ">" / ">=" - цена выше уровня, "<" / "<=" - ниже уровня.
+        :return: Созданный Alert.
+        :raises ValueError: если превышен лимит алертов пользователя.
+        """
+        if len(self.list_for_chat(chat_id)) >= self.max_per_chat:
+            raise ValueError(f"Максимум {self.max_per_chat} алертов")
+        op = ">" if op.startswith(">") else "<"
+        symbol = symbol.upper()
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT INTO alerts (chat_id, symbol, op, threshold, created) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, symbol, op, threshold, time.time()),
+        )
+        conn.commit()
+        alert = Alert(cursor.lastrowid, chat_id, symbol, op, threshold)
+        if self.active:
+            self._insert(alert)
+        return alert
+
+    def remove(self, chat_id: int, alert_id: int):
+        """
+        Удаляет алерт пользователя.
+
+        :return: True, если алерт был удален.
+        """
+        conn = self._connect()
+        deleted = conn.execute("DELETE FROM alerts WHERE id = ? AND chat_id = ?", (alert_id, chat_id)).rowcount
+        conn.commit()
+        alert = self._alerts.pop(alert_id, None)
+        if alert is not None:
+            self._index[alert.symbol].remove(alert)
+        return bool(deleted)
+
+    def on_tick(self, symbol: str, price: float):
+        """
+        Проверяет алерты символа при обновлении цены и ставит сработавшие в очередь отправки.
+        """
+        index = self._index.get(symbol)
+        if not index:
+            return
+        for alert_id in index.pop_crossed(price):
+            alert = self._alerts.pop(alert_id)
+            self._queue.put_nowait((alert, price))
+
+    async def _sender(self, bot):
+        """
+        Отправляет уведомления не чаще send_rate в секунду и удаляет сработавшие алерты из базы.
+        """
+        interval = 1.0 / self.send_rate
+        while True:
+            alert, price = await self._queue.get()
+            try:
+                # Алерт мог быть удален через /unalert в другом воркере или уже отправлен
+                if not await asyncio.to_thread(self._delete, alert.id):
+                    continue
+                sign = "≥" if alert.op == ">" else "≤"
+                await bot.send_message(
+                    alert.chat_id,
+                    f"🔔 *{alert.symbol}* {sign} {alert.threshold:g}\n💰 Текущая цена: {price:g}",
+                )
+            except Exception as e:
+                logger.error(f"Error sending alert {alert.id}: {e}")
+            await asyncio.sleep(interval)
+
+    def _delete(self, alert_id: int):
+        """
+        Удаляет алерт из базы.
+
+        :return: True, если алерт был в базе.
+        """
+        conn = self._connect()
+        deleted = conn.execute("DELETE FROM alerts WHERE id = ?", (alert_id,)).rowcount
+        conn.commit()
+        return bool(deleted)
+
+    async def _watch(self, get_price, interval: float):
+        """
+        Периодически запрашивает цены спотовых символов с алертами (одна цена - один запрос).
+        """
+        p2p_symbols = set(P2P_ALERT_SYMBOLS.values())
+        while True:
+            # Подхватываем алерты, добавленные и удаленные другими воркерами
+            try:
+                self.load(await asyncio.to_thread(self._read))
+            except Exception as e:
+                logger.error(f"Error reloading alerts: {e}")
+            symbols = [s for s in self.symbols() if s not in p2p_symbols]
+            results = await asyncio.gather(*(get_price(s) for s in symbols), return_exceptions=True)
+            for symbol, result in zip(symbols, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Alert watcher error ({symbol}): {result}")
+                else:
+                    self.on_tick(symbol, result)
+            await asyncio.sleep(interval)
+
+    def setup(self, dp, bot, get_price, interval: float = 10.0, primary: bool = True):
+        """
+        Подключает загрузку алертов, отправку уведомлений и фоновую проверку цен к диспетчеру.
+
+        :param get_price: Асинхронная функция get_price(symbol) -> последняя цена.
+        :param interval: Интервал фоновой проверки цен в секундах.
+        :param primary: Вести индексы и отправку в этом процессе (при шардировании - только в одном воркере).
+        """
+        async def start():
+            if not primary:
+                return
+            self.active = True
+            await asyncio.to_thread(self.load)
+            self._tasks = [
+                asyncio.create_task(self._sender(bot)),
+                asyncio.create_task(self._watch(get_price, interval)),
+            ]
+
+        async def stop():
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            self.active = False
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        dp.startup.register(start)
+        dp.shutdown.register(stop)
+
+
+def on_p2p_quote(venue: str, side: str, parsed: dict):
+    """
+    Передает среднюю цену P2P-снимка в движок алертов.
+    """
+    if parsed:
+        alert_engine.on_tick(P2P_ALERT_SYMBOLS[(venue, side)], parsed["avg_price"])
+
+
+def parse_alert(text: str):
+    """
+    Парсит аргументы /alert вида "BTCUSDT > 70000".
+
+    :return: Кортеж (symbol, op, threshold) или None.
+    """
+    match = ALERT_PATTERN.match(text or "")
+    if not match:
+        return None
+    return match.group(1).upper(), match.group(2), float(match.group(3).replace(",", "."))
+
+
+# Общий движок алертов (путь к базе настраивается через ALERTS_DB в .env)
+alert_engine = AlertEngine(
+    path=os.getenv('ALERTS_DB', 'alerts.sqlite3'),
+    max_per_chat=int(os.getenv('ALERTS_PER_CHAT', '20')),
+    send_rate=float(os.getenv('ALERTS_SEND_RATE', '20')),
+)
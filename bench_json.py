@@ -0,0 +1,129 @@
+"""
+Микробенчмарк разбора P2P-ответов: полный разбор stdlib json, полный разбор
+orjson (если установлен) и частичный разбор первых N предложений.
+
+Запуск: python bench_json.py --offers 50 --repeat 2000
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import fastjson
+from bybit_p2p import decode_bybit_p2p, parse_bybit_p2p_data
+from huobi import decode_huobi_p2p, parse_huobi_p2p_data
+
+
+def make_huobi_response(offers: int):
+    """
+    Ответ HTX, похожий на настоящий: у каждого предложения ~30 полей.
+    """
+    data = []
+    for index in range(offers):
+        data.append({
+            "id": 1000000 + index, "uid": 200000 + index, "userName": f"merchant{index}",
+            "merchantLevel": 2, "coinId": 2, "currency": 172, "tradeType": 1, "blockType": 1,
+            "payMethod": "29,28", "payMethods": [
+                {"payMethodId": 29, "name": "Alipay", "color": "#1677FF", "isRecommend": None},
+                {"payMethodId": 28, "name": random.choice(["WeChat", "Bank"]), "color": "#07C160",
+                 "isRecommend": None},
+            ],
+            "payTerm": 15, "payName": "[{\"bankType\":29,\"id\":1}]",
+            "minTradeLimit": "100", "maxTradeLimit": "50000.00", "price": f"{7.2 + random.random() / 10:.3f}",
+            "tradeCount": "12345.6789", "isOnline": True, "tradeMonthTimes": 1500,
+            "appealMonthTimes": 0, "appealMonthWinTimes": 0, "takerAcceptOrder": 0,
+            "takerAcceptAmount": "0", "takerLimit": 0, "orderCompleteRate": "99.5",
+            "isCopyBlock": False, "thumbUp": 120, "isFollowed": False, "labelName": None,
+            "seaViewRoom": None, "authCertificate": None,
+        })
+    return json.dumps({
+        "code": 200, "message": "Success", "totalCount": offers * 10, "pageSize": offers,
+        "totalPage": 10, "currPage": 1, "data": data, "success": True,
+    }).encode()
+
+
+def make_bybit_response(offers: int):
+    """
+    Ответ Bybit P2P с типичным набором полей предложения.
+    """
+    items = []
+    for index in range(offers):
+        items.append({
+            "id": str(1800000000000000000 + index), "accountId": str(100000 + index),
+            "userId": str(200000 + index), "nickName": f"trader{index}", "tokenId": "USDT",
+            "tokenName": "", "currencyId": "RUB", "side": 1, "priceType": 0,
+            "price": f"{95 + random.random():.2f}", "premium": "", "lastQuantity": "1520.5",
+            "quantity": "1520.5", "frozenQuantity": "0", "executedQuantity": "4800",
+            "minAmount": "1000", "maxAmount": "144447.5", "remark": "Быстро, без третьих лиц. " * 5,
+            "status": 10, "createDate": "1700000000000", "payments": ["382", "75"],
+            "orderNum": 0, "finishNum": 850, "recentOrderNum": 120, "recentExecuteRate": 98,
+            "fee": "", "isOnline": True, "lastLogoutTime": "1700000000000", "blocked": "",
+            "makerContact": False, "symbolInfo": {"id": "5", "exchangeId": "1", "orgId": "9001",
+                                                  "tokenId": "USDT", "currencyId": "RUB", "status": 1},
+            "tradingPreferenceSet": {"hasUnPostAd": 0, "isKyc": 1, "isEmail": 0, "isMobile": 0,
+                                     "hasRegisterTime": 0, "registerTimeThreshold": 0},
+            "version": 12, "authStatus": 2, "recommend": False, "recommendTag": "",
+            "authTag": ["GA"], "userType": "PERSONAL", "itemType": "ORIGIN",
+        })
+    return json.dumps({
+        "ret_code": 0, "ret_msg": "SUCCESS",
+        "result": {"count": offers * 10, "items": items},
+        "ext_code": "", "ext_info": {}, "time_now": "1700000000.000000",
+    }).encode()
+
+
+def measure(name: str, func, repeat: int):
+    """
+    Печатает CPU-время на один вызов и пиковый объем памяти одного вызова.
+    """
+    func()  # прогрев
+    started = time.process_time()
+    for _ in range(repeat):
+        func()
+    per_call = (time.process_time() - started) / repeat
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<18} {per_call * 1e6:9.1f} µs/call   peak {peak / 1024:8.1f} KiB")
+    return per_call
+
+
+def _stdlib(decode, raw: bytes):
+    """
+    Полный разбор без orjson (как при отсутствии необязательной зависимости).
+    """
+    backend, fastjson.orjson = fastjson.orjson, None
+    try:
+        return decode(raw, mode="full")
+    finally:
+        fastjson.orjson = backend
+
+
+def run_case(title: str, raw: bytes, decode, parse, repeat: int):
+    print(f"{title}: {len(raw) / 1024:.1f} KiB")
+    baseline = measure("stdlib json.loads", lambda: json.loads(raw), repeat)
+    results = {}
+    if fastjson.orjson is not None:
+        results["full (orjson)"] = measure("full (orjson)", lambda: parse(decode(raw, mode="full")), repeat)
+    results["full (stdlib)"] = measure("full (stdlib)", lambda: parse(_stdlib(decode, raw)), repeat)
+    results["partial"] = measure("partial", lambda: parse(decode(raw, mode="partial")), repeat)
+    for name, per_call in results.items():
+        print(f"  {name}: x{baseline / per_call:.1f} vs stdlib json.loads")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк разбора P2P-ответов")
+    parser.add_argument("--offers", type=int, default=50, help="Предложений в ответе")
+    parser.add_argument("--repeat", type=int, default=2000, help="Повторов на вариант")
+    args = parser.parse_args()
+
+    random.seed(1)
+    run_case("HTX", make_huobi_response(args.offers), decode_huobi_p2p, parse_huobi_p2p_data, args.repeat)
+    run_case("Bybit", make_bybit_response(args.offers), decode_bybit_p2p, parse_bybit_p2p_data, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
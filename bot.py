@@ -1,41 +1,319 @@
 import logging
 import asyncio
 import os
-import aiohttp
-from aiogram import Bot, Dispatcher, types, Router, F
+import sys
+
+# Профиль запуска: python bot.py --profile-startup (до тяжелых импортов, бот не запускается)
+if __name__ == "__main__" and "--profile-startup" in sys.argv:
+    from startup import profile_startup
+    sys.exit(profile_startup("bot"))
+
+# Воркеры spawn заново выполняют главный модуль как __mp_main__. Регистрируем его
+# и под именем bot, чтобы import bot в sharding.py не создавал второй бот и диспетчер
+if __name__ in ("__main__", "__mp_main__"):
+    sys.modules.setdefault("bot", sys.modules[__name__])
+
+from aiogram import Bot, Dispatcher, Router, F
 from aiogram.enums import ParseMode
 from aiogram.types import Message, CallbackQuery, BotCommand, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from aiogram.client.default import DefaultBotProperties
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from pybit.unified_trading import HTTP
 from dotenv import load_dotenv
-from stars import get_ton_rub_price, calculate_star_price
+
+# Загружаем переменные из .env (до импорта модулей, которые читают настройки)
+load_dotenv()
+
+from stars import get_ton_rub_quote, get_leg_price, dump_leg_cache, restore_leg_cache, calculate_star_price, format_star_price_table, TonPriceError, MAX_GRID_CELLS
 
 # Импортируем клавиатуру из keyboards.py
-from keyboards import get_main_menu_keyboard, get_inline_bybit_keyboard
+from keyboards import get_main_menu_keyboard, get_inline_bybit_keyboard, get_back_keyboard
 
 # Импортируем роутер Huobi из huobi.py
-from huobi import huobi_router
+from huobi import huobi_router, fetch_huobi_p2p, fetch_huobi_depth
+
+# Общая сессия aiohttp для запросов к биржам
+from http_session import setup_session
+
+# P2P-запросы к Bybit и фоновый опрос P2P-площадок
+from bybit_p2p import fetch_bybit_p2p, fetch_bybit_depth
+from depth import format_fill
+from p2p_poller import p2p_poller, parse_tiers, format_age
+
+# Кеш спотовых тикеров Bybit и таблица всех тикеров
+from ticker_cache import TickerCache
+from ticker_table import TickerTable
+
+# Метрики хендлеров и запросов к биржам
+from metrics import setup_metrics, record_cache
+
+# История котировок
+from history import history_store, record_ticker, parse_period, format_history, HISTORY_SERIES, HISTORY_P2P_AMOUNTS
+
+# Inline-режим
+from inline_engine import InlineEngine
+
+# Кеш отрендеренных ответов
+from render import render_spot, render_bybit_p2p
+
+# Ценовые алерты
+from alerts import alert_engine, parse_alert, P2P_ALERT_SYMBOLS
+
+# Планировщик исходящих сообщений (лимиты Telegram)
+from outbound import SendScheduler
+
+# Слой устойчивости запросов к биржам
+from resilience import UpstreamUnavailable, format_stale
+
+# Матрица кросс-курсов по всем площадкам
+from rate_matrix import RateMatrix, RateSource
+
+# Свечные графики (отрисовка в пуле процессов)
+from chart import ChartService, ChartError, parse_chart_args
+
+# Снимок кешей котировок на диске для быстрого старта
+from quote_store import quote_store
+
+# Хранилище FSM
+from fsm_storage import create_storage
+
+# Ленивое создание клиентов бирж и отметки шагов запуска
+from startup import LazyClient, mark
+
+mark("imports")
 
 # Включаем логирование
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Загружаем переменные из .env
-load_dotenv()
+# Настройки из .env
 TOKEN = os.getenv('TOKEN')
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # "polling" или "webhook"
+WORKERS = int(os.getenv('WORKERS', '1'))  # Количество процессов-воркеров в режиме polling
+SHARD = os.getenv('BOT_SHARD')  # Номер воркера при шардировании (задается sharding.py)
+PRIMARY = SHARD in (None, '0')  # Процесс, который выполняет фоновые задачи (опрос бирж, алерты)
 
 # Создаем бота и диспетчер
 bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
-dp = Dispatcher()
+dp = Dispatcher(storage=create_storage())  # Хранилище FSM выбирается через FSM_STORAGE
+
+# Все исходящие сообщения проходят через планировщик с лимитами и пропуском одинаковых правок.
+# Общий лимит Telegram при шардировании делится между воркерами (лимиты чатов - нет:
+# каждый чат обслуживает один воркер)
+send_scheduler = SendScheduler(
+    global_rate=float(os.getenv('SEND_GLOBAL_RATE', '30')) / (WORKERS if SHARD is not None else 1),
+    chat_rate=float(os.getenv('SEND_CHAT_RATE', '1')),
+    chat_burst=float(os.getenv('SEND_CHAT_BURST', '3')),
+    group_rate=float(os.getenv('SEND_GROUP_RATE', '0.33')),
+    max_retries=int(os.getenv('SEND_MAX_RETRIES', '3')),
+)
+bot.session.middleware(send_scheduler)
+mark("bot and dispatcher")
+
+# Фоновые задачи (WebSocket, опрос P2P, таблица тикеров, матрица курсов) выполняются
+# только в основном процессе, чтобы при шардировании не умножать нагрузку на биржи.
+# Остальные воркеры запрашивают котировки по требованию через те же кеши.
+
+# Книга цен из WebSocket (включается через BYBIT_WS_ENABLED=1 в .env)
+price_book = None
+if os.getenv('BYBIT_WS_ENABLED') == '1' and PRIMARY:
+    from price_book import PriceBook, BYBIT_SPOT_WS_URL
+
+    price_book = PriceBook(
+        symbols=os.getenv('BYBIT_WS_SYMBOLS', 'BTCUSDT,ETHUSDT').split(','),
+        url=os.getenv('BYBIT_WS_URL', BYBIT_SPOT_WS_URL),
+        stale_after=float(os.getenv('BYBIT_WS_STALE_AFTER', '10')),
+        on_update=lambda ticker: alert_engine.on_tick(ticker['symbol'], float(ticker['lastPrice'])),
+    )
+    dp.startup.register(price_book.start)
+    dp.shutdown.register(price_book.stop)
+
+# Фоновый опрос P2P по уровням сумм (уровни и интервалы настраиваются в .env).
+# Сумма, которая пишется в историю, опрашивается всегда.
+for side in ("buy", "sell"):
+    p2p_poller.register(
+        "bybit", side, fetch_bybit_p2p,
+        tiers=parse_tiers(os.getenv('BYBIT_P2P_TIERS', '1000,5000,10000,50000,100000')) + [HISTORY_P2P_AMOUNTS['bybit_p2p']],
+        interval=float(os.getenv('BYBIT_P2P_REFRESH', '15')),
+    )
+    p2p_poller.register(
+        "huobi", side, fetch_huobi_p2p,
+        tiers=parse_tiers(os.getenv('HUOBI_P2P_TIERS', '100,1000,5000,10000')) + [HISTORY_P2P_AMOUNTS['htx_p2p']],
+        interval=float(os.getenv('HUOBI_P2P_REFRESH', '20')),
+    )
+if PRIMARY:
+    dp.startup.register(p2p_poller.start)
+    dp.shutdown.register(p2p_poller.stop)
+
+# Метрики: время хендлеров и, если задан METRICS_PORT, локальный эндпоинт /metrics
+# При шардировании каждый воркер слушает свой порт: METRICS_PORT + номер воркера
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+setup_metrics(
+    dp,
+    host=os.getenv('METRICS_HOST', '127.0.0.1'),
+    port=METRICS_PORT + int(SHARD or 0) if METRICS_PORT else None,
+    commands=("start", "starsgrid", "history", "depth", "chart", "alert", "alerts", "unalert"),
+    callbacks=("back", "bybit", "huobi", "stars", "rates", "btcusdt", "ethusdt", "spot", "chart",
+               "usdtbuyrub", "usdtrubsell", "usdtcnybuy", "usdtcnysell"),
+)
+
+# История котировок пишется только в основном процессе и сбрасывается на диск при остановке
+history_store.setup(dp, primary=PRIMARY)
+
+# Общая сессия открывается и закрывается вместе с диспетчером
+setup_session(dp)
+mark("background jobs")
 
 # Создаем роутер
 router = Router()
 
-# Создаем сессию для подключения к основной сети Bybit
-session = HTTP(testnet=False)
+def create_bybit_http():
+    """
+    Создает сессию pybit для основной сети Bybit (pybit импортируется только здесь).
+    """
+    from pybit.unified_trading import HTTP
+
+    return HTTP(testnet=False)
+
+
+# Сессия для подключения к основной сети Bybit создается при первом запросе
+session = LazyClient(create_bybit_http)
+
+# Кеш спотовых тикеров (общий для кнопок и inline-режима)
+ticker_cache = TickerCache(session, ttl=float(os.getenv('TICKER_CACHE_TTL', '2')))
+
+# Таблица всех спотовых тикеров, обновляется одним запросом (TICKER_TABLE_REFRESH=0 - выключить)
+ticker_table = None
+if float(os.getenv('TICKER_TABLE_REFRESH', '5')) > 0 and PRIMARY:
+    ticker_table = TickerTable(session, interval=float(os.getenv('TICKER_TABLE_REFRESH', '5')))
+    dp.startup.register(ticker_table.start)
+    dp.shutdown.register(ticker_table.stop)
+
+# Графики: свечи через сессию pybit, отрисовка в CHART_WORKERS процессах
+chart_service = ChartService(session, workers=int(os.getenv('CHART_WORKERS', '2')))
+dp.startup.register(chart_service.start)
+dp.shutdown.register(chart_service.stop)
+
+# Кеши котировок, которые сохраняются на диск и загружаются при запуске.
+# Кеш отдельных тикеров (TTL 2 с) не сохраняется: к концу запуска он всегда устарел.
+# Таблица рынка (устаревает через 3 интервала) переживает штатный перезапуск,
+# так как снимок сохраняется при остановке.
+if ticker_table is not None:
+    quote_store.register("ticker_table", ticker_table.dump_state, ticker_table.restore_state)
+quote_store.register("p2p", p2p_poller.dump_state, p2p_poller.restore_state)
+quote_store.register("binance_legs", dump_leg_cache, restore_leg_cache)
+
+
+async def get_spot_ticker(symbol: str):
+    """
+    Возвращает тикер спотовой пары: из книги WebSocket, если она свежая,
+    затем из таблицы всех тикеров, иначе через REST-кеш.
+    """
+    data = None
+    if price_book is not None:
+        data = price_book.get(symbol)
+        record_cache("bybit_ws", data is not None)
+    if data is None and ticker_table is not None:
+        data = ticker_table.get(symbol)
+    if data is None:
+        data = await ticker_cache.get(symbol)
+    # Сохраненные данные (биржа недоступна) не пишем в историю и не проверяем по ним алерты
+    if data.get('stale_age') is None:
+        record_ticker(data)
+        alert_engine.on_tick(data['symbol'], float(data['lastPrice']))
+    return data
+
+
+async def get_last_price(symbol: str):
+    """
+    Возвращает последнюю цену спотовой пары (для фоновой проверки алертов).
+
+    :raises UpstreamUnavailable: если есть только сохраненная цена.
+    """
+    data = await get_spot_ticker(symbol)
+    if data.get('stale_age') is not None:
+        raise UpstreamUnavailable(f"{symbol}: only stale price available")
+    return float(data['lastPrice'])
+
+
+async def get_p2p_quote(venue: str, side: str, amount: float):
+    """
+    Возвращает P2P-котировку из снимка ближайшего уровня или запрашивает ее.
+
+    :return: Кортеж (данные, возраст снимка или None).
+    """
+    snapshot = p2p_poller.get(venue, side, amount)
+    if snapshot:
+        return snapshot[0], snapshot[1]
+    fetch = fetch_bybit_p2p if venue == "bybit" else fetch_huobi_p2p
+    data = await fetch(amount, side)
+    return data, data.get('stale_age') if data else None
+
+
+# Inline-режим: все спотовые пары и P2P с подсказками по префиксу
+inline_engine = InlineEngine(
+    session, get_spot_ticker, get_p2p_quote,
+    ticker_ttl=ticker_cache.ttl,
+    p2p_ttl=float(os.getenv('BYBIT_P2P_REFRESH', '15')),
+)
+inline_engine.setup(dp, primary=PRIMARY)
+
+def is_known_spot_symbol(symbol: str):
+    """
+    Проверяет символ по таблице тикеров или списку пар inline-режима без запроса к бирже.
+
+    :return: True или False; None, если списков пар еще нет.
+    """
+    if ticker_table is not None and ticker_table.updated_at is not None:
+        return symbol in ticker_table
+    if inline_engine.loaded:
+        return symbol in inline_engine.index.symbols
+    return None
+
+
+# Алерты: загрузка из базы, отправка уведомлений и фоновая проверка цен
+alert_engine.setup(dp, bot, get_last_price, interval=float(os.getenv('ALERTS_POLL_INTERVAL', '10')), primary=PRIMARY)
+
+async def get_p2p_avg_price(venue: str, side: str, amount: float):
+    """
+    Средняя P2P-цена для матрицы курсов (None, если предложений нет).
+    """
+    data, _ = await get_p2p_quote(venue, side, amount)
+    return data['avg_price'] if data else None
+
+
+async def get_spot_price(symbol: str):
+    return float((await get_spot_ticker(symbol))['lastPrice'])
+
+
+async def get_binance_price(symbol: str):
+    return (await get_leg_price(symbol))[0]
+
+
+# Матрица кросс-курсов для пункта меню "Rates" (RATE_MATRIX_REFRESH=0 - выключить)
+RATE_MATRIX_RUB_AMOUNT = float(os.getenv('RATE_MATRIX_RUB_AMOUNT', '5000'))
+RATE_MATRIX_CNY_AMOUNT = float(os.getenv('RATE_MATRIX_CNY_AMOUNT', '1000'))
+rate_matrix = RateMatrix([
+    RateSource("RUB", "Bybit P2P buy", lambda: get_p2p_avg_price("bybit", "buy", RATE_MATRIX_RUB_AMOUNT)),
+    RateSource("RUB", "Bybit P2P sell", lambda: get_p2p_avg_price("bybit", "sell", RATE_MATRIX_RUB_AMOUNT)),
+    RateSource("RUB", "Binance", lambda: get_binance_price("USDTRUB")),
+    RateSource("CNY", "HTX P2P buy", lambda: get_p2p_avg_price("huobi", "buy", RATE_MATRIX_CNY_AMOUNT)),
+    RateSource("CNY", "HTX P2P sell", lambda: get_p2p_avg_price("huobi", "sell", RATE_MATRIX_CNY_AMOUNT)),
+    RateSource("TON", "Bybit", lambda: get_spot_price("TONUSDT"), inverted=True),
+    RateSource("TON", "Binance", lambda: get_binance_price("TONUSDT"), inverted=True),
+    RateSource("BTC", "Bybit", lambda: get_spot_price("BTCUSDT"), inverted=True),
+    RateSource("ETH", "Bybit", lambda: get_spot_price("ETHUSDT"), inverted=True),
+], interval=float(os.getenv('RATE_MATRIX_REFRESH', '30')))
+if rate_matrix.interval > 0 and PRIMARY:
+    dp.startup.register(rate_matrix.start)
+    dp.shutdown.register(rate_matrix.stop)
+
+# Площадки для /depth: валюта -> (загрузка стакана, заголовок, валюта)
+DEPTH_VENUES = {
+    "rub": (fetch_bybit_depth, "💱 Bybit P2P USDT/RUB", "₽"),
+    "cny": (fetch_huobi_depth, "🇨🇳 Huobi P2P USDT/CNY", "CNY"),
+}
 
 class Form(StatesGroup):
     amount = State()  # Для P2P
@@ -46,6 +324,13 @@ class Form(StatesGroup):
 async def set_bot_commands(bot: Bot):
     commands = [
         BotCommand(command="/start", description="Запустить бота"),
+        BotCommand(command="/starsgrid", description="Таблица цен звезд: /starsgrid 0.42,0.45 100,500"),
+        BotCommand(command="/history", description="История курса: /history btc 24h"),
+        BotCommand(command="/depth", description="Цена крупной заявки: /depth rub buy 500000"),
+        BotCommand(command="/chart", description="Свечной график: /chart BTCUSDT 1h"),
+        BotCommand(command="/alert", description="Алерт: /alert BTCUSDT > 70000"),
+        BotCommand(command="/alerts", description="Мои алерты"),
+        BotCommand(command="/unalert", description="Удалить алерт: /unalert <id>"),
     ]
     await bot.set_my_commands(commands)
 
@@ -62,13 +347,208 @@ async def start_command(message: Message):
 async def stars_callback(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         "Введите курс (сколько TON за 100 звезд, например 0.42):",
-        reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
-            [types.InlineKeyboardButton(text="Назад", callback_data="back")]
-        ])
+        reply_markup=get_back_keyboard("back")
     )
     await state.set_state(Form.stars_ratio)
 
 
+# Обработчик команды /starsgrid (таблица цен для нескольких курсов и количеств)
+@router.message(Command("starsgrid"))
+async def stars_grid_command(message: Message, command: CommandObject, state: FSMContext):
+    usage = (
+        "Использование: `/starsgrid <курсы> <количества>`\n"
+        "Например: `/starsgrid 0.42,0.45 100,500,1000`"
+    )
+    try:
+        ratios_arg, counts_arg = (command.args or "").split()
+        ratios = [float(r) for r in ratios_arg.split(",") if r]
+        counts = [int(c) for c in counts_arg.split(",") if c]
+        if not ratios or not counts or any(c <= 0 for c in counts):
+            raise ValueError
+    except ValueError:
+        await message.answer(usage, parse_mode=ParseMode.MARKDOWN)
+        return
+
+    if len(ratios) * len(counts) > MAX_GRID_CELLS:
+        await message.answer(f"Слишком большая таблица: максимум {MAX_GRID_CELLS} сочетаний.")
+        return
+
+    await state.clear()
+    try:
+        ton_price, stale_age = await get_ton_rub_quote()
+    except TonPriceError as e:
+        await message.answer(f"Ошибка: {e}", reply_markup=get_main_menu_keyboard())
+        return
+
+    text = format_star_price_table(ton_price, ratios, counts)
+    if stale_age is not None:
+        text += f"\n\n{format_stale(stale_age)}"
+    await message.answer(
+        text,
+        reply_markup=get_main_menu_keyboard(),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
+# Обработчик команды /history (история курса из локального хранилища)
+@router.message(Command("history"))
+async def history_command(message: Message, command: CommandObject, state: FSMContext):
+    usage = (
+        "Использование: `/history <ряд> [период]`\n"
+        f"Ряды: {', '.join(HISTORY_SERIES)}\n"
+        "Период: 30m, 6h, 24h, 7d (по умолчанию 24h)"
+    )
+    args = (command.args or "").lower().split()
+    if not args or args[0] not in HISTORY_SERIES:
+        await message.answer(usage, parse_mode=ParseMode.MARKDOWN)
+        return
+    period = parse_period(args[1]) if len(args) > 1 else 86400
+    if period is None:
+        await message.answer(usage, parse_mode=ParseMode.MARKDOWN)
+        return
+
+    await state.clear()
+    await message.answer(format_history(args[0], period), parse_mode=ParseMode.MARKDOWN)
+
+
+async def send_chart(message: Message, symbol: str, interval: str):
+    """
+    Отправляет свечной график в чат сообщения.
+    """
+    # Символ проверяется по спискам пар, чтобы опечатки не уходили на Bybit
+    if is_known_spot_symbol(symbol) is False:
+        await message.answer(f"❌ Unknown symbol: {symbol}")
+        return
+    try:
+        await chart_service.send(message, symbol, interval)
+    except ChartError as e:
+        await message.answer(f"❌ {e}")
+    except Exception as e:
+        logger.error(f"Error sending chart {symbol} {interval}: {e!r}")
+        await message.answer(f"⚠ Error: {str(e)}")
+
+
+# Обработчик команды /chart (свечной график спотовой пары)
+@router.message(Command("chart"))
+async def chart_command(message: Message, command: CommandObject, state: FSMContext):
+    try:
+        symbol, interval = parse_chart_args(command.args)
+    except ChartError as e:
+        await message.answer(f"{e}\nИнтервалы: 5m, 15m, 1h, 4h, 1d")
+        return
+    await state.clear()
+    await send_chart(message, symbol, interval)
+
+
+# Обработчик кнопок графиков (callback_data="chart:<SYMBOL>:<интервал>")
+@router.callback_query(F.data.startswith("chart:"))
+async def chart_callback(callback: CallbackQuery):
+    # callback_data приходит от клиента, поэтому проверяется так же, как аргументы /chart
+    try:
+        parts = callback.data.split(":")
+        if len(parts) != 3 or not all(parts[1:]):
+            raise ChartError("Неверная кнопка графика")
+        symbol, interval = parse_chart_args(f"{parts[1]} {parts[2]}")
+    except ChartError as e:
+        await callback.answer(f"❌ {e}", show_alert=True)
+        return
+    await callback.answer()
+    await send_chart(callback.message, symbol, interval)
+
+
+# Обработчик команды /depth (эффективная цена крупной заявки по нескольким страницам стакана)
+@router.message(Command("depth"))
+async def depth_command(message: Message, command: CommandObject, state: FSMContext):
+    usage = (
+        "Использование: `/depth <rub|cny> <buy|sell> <сумма>`\n"
+        "Например: `/depth rub buy 500000`"
+    )
+    args = (command.args or "").lower().split()
+    if len(args) != 3 or args[0] not in DEPTH_VENUES or args[1] not in ("buy", "sell"):
+        await message.answer(usage, parse_mode=ParseMode.MARKDOWN)
+        return
+    try:
+        amount = float(args[2].replace(",", "."))
+    except ValueError:
+        await message.answer(usage, parse_mode=ParseMode.MARKDOWN)
+        return
+    if amount <= 0:
+        await message.answer(usage, parse_mode=ParseMode.MARKDOWN)
+        return
+
+    await state.clear()
+    fetch, title, currency = DEPTH_VENUES[args[0]]
+    try:
+        result = await fetch(amount, args[1])
+    except Exception as e:
+        logger.error(f"Error in depth_command: {e}")
+        await message.answer(f"⚠ Error: {str(e)}")
+        return
+    await message.answer(format_fill(f"{title} {args[1].upper()}", currency, result))
+
+
+# Обработчик команды /alert (подписка на уровень цены)
+@router.message(Command("alert"))
+async def alert_command(message: Message, command: CommandObject, state: FSMContext):
+    parsed = parse_alert(command.args)
+    if parsed is None:
+        await message.answer(
+            "Использование: `/alert BTCUSDT > 70000` или `/alert RUBSELL < 90`\n"
+            "P2P: RUBBUY, RUBSELL, CNYBUY, CNYSELL (средняя цена)",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+
+    await state.clear()
+    symbol, op, threshold = parsed
+    if symbol not in P2P_ALERT_SYMBOLS.values():
+        known = is_known_spot_symbol(symbol)
+        if known is None:
+            # Списков пар еще нет: проверяем запросом (ошибка запроса не размыкает автомат защиты)
+            try:
+                await get_spot_ticker(symbol)
+                known = True
+            except Exception:
+                known = False
+        if not known:
+            await message.answer(f"❌ Неизвестный символ {symbol}.")
+            return
+
+    try:
+        alert = alert_engine.add(message.chat.id, symbol, op, threshold)
+    except ValueError as e:
+        await message.answer(f"❌ {e}")
+        return
+    await message.answer(f"🔔 Алерт #{alert.id}: {symbol} {op} {threshold:g}")
+
+
+# Обработчик команды /alerts (список алертов пользователя)
+@router.message(Command("alerts"))
+async def alerts_command(message: Message, state: FSMContext):
+    await state.clear()
+    alerts = alert_engine.list_for_chat(message.chat.id)
+    if not alerts:
+        await message.answer("У вас нет активных алертов.")
+        return
+    lines = [f"#{a.id}: {a.symbol} {a.op} {a.threshold:g}" for a in alerts]
+    await message.answer("🔔 Ваши алерты:\n" + "\n".join(lines))
+
+
+# Обработчик команды /unalert (удаление алерта)
+@router.message(Command("unalert"))
+async def unalert_command(message: Message, command: CommandObject, state: FSMContext):
+    await state.clear()
+    try:
+        alert_id = int((command.args or "").strip().lstrip("#"))
+    except ValueError:
+        await message.answer("Использование: `/unalert <id>`", parse_mode=ParseMode.MARKDOWN)
+        return
+    if alert_engine.remove(message.chat.id, alert_id):
+        await message.answer(f"Алерт #{alert_id} удален.")
+    else:
+        await message.answer(f"❌ Алерт #{alert_id} не найден.")
+
+
 @router.message(Form.stars_ratio)
 async def process_stars_ratio(message: Message, state: FSMContext):
     try:
@@ -78,9 +558,7 @@ async def process_stars_ratio(message: Message, state: FSMContext):
 
         await message.answer(
             "Теперь введите количество звезд:",
-            reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
-                [types.InlineKeyboardButton(text="Назад", callback_data="stars")]
-            ])
+            reply_markup=get_back_keyboard("stars")
         )
         await state.set_state(Form.stars_count)
 
@@ -102,9 +580,10 @@ async def process_stars_count(message: Message, state: FSMContext):
         data = await state.get_data()
         stars_to_ton_ratio = data.get('stars_ratio')
 
-        ton_price = get_ton_rub_price()
-        if isinstance(ton_price, str) and ton_price.startswith("Ошибка"):
-            await message.answer(ton_price, reply_markup=get_main_menu_keyboard())
+        try:
+            ton_price, stale_age = await get_ton_rub_quote()
+        except TonPriceError as e:
+            await message.answer(f"Ошибка: {e}", reply_markup=get_main_menu_keyboard())
             await state.clear()
             return
 
@@ -118,9 +597,11 @@ async def process_stars_count(message: Message, state: FSMContext):
             f"📊 *Сравнение с курсом 1.65 ₽/звезда:*\n"
             f"• Стоимость по 1.65: {calculation['standard_price']} ₽\n"
             f"• Разница за 1 звезду: {calculation['price_difference']} ₽\n"
-            f"• Общая разница: {round(calculation['price_difference'] * stars_count, 2)} ₽\n\n"
+            f"• Общая разница: {calculation['total_difference']} ₽\n\n"
             f"💎 *Текущая цена TON/RUB:* {calculation['ton_price']} ₽"
         )
+        if stale_age is not None:
+            result_text += f"\n\n{format_stale(stale_age)}"
 
         await message.answer(result_text, reply_markup=get_main_menu_keyboard(), parse_mode=ParseMode.MARKDOWN)
         await state.clear()
@@ -139,7 +620,9 @@ async def bybit_callback(callback: CallbackQuery):
         "💲 Bybit Menu:\n\n"
         "💰 *SPOT Market:*\n"
         "1️⃣ *BTC/USDT* – Current price of BTC on Bybit SPOT.\n"
-        "2️⃣ *ETH/USDT* – Current price of ETH on Bybit SPOT.\n\n"
+        "2️⃣ *ETH/USDT* – Current price of ETH on Bybit SPOT.\n"
+        "🔹 *More pairs* – SOL, TON, XRP, DOGE and any pair in inline mode.\n"
+        "📈 *Charts* – BTC and ETH candles, any pair via /chart.\n\n"
         "💱 *P2P Market (USDT/RUB):*\n"
         "3️⃣ *Buy* – P2P price for buying USDT.\n"
         "4️⃣ *Sell* – P2P price for selling USDT.",
@@ -155,31 +638,44 @@ async def back_callback(callback: CallbackQuery):
         reply_markup=get_main_menu_keyboard()  # Возвращаемся к главному меню
     )
 
+# Обработчик кнопки "Rates": матрица кросс-курсов отдается из фонового расчета
+# (в воркерах без фоновых задач - пересчитывается по запросу не чаще интервала)
+@router.callback_query(F.data == "rates")
+async def rates_callback(callback: CallbackQuery):
+    text = await rate_matrix.current() or "⏳ Rates are being collected, try again in a few seconds."
+    await callback.message.edit_text(
+        text,
+        reply_markup=get_back_keyboard("back"),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# Обработчик кнопок дополнительных спотовых пар (callback_data="spot:<SYMBOL>")
+@router.callback_query(F.data.startswith("spot:"))
+async def spot_symbol_callback(callback: CallbackQuery):
+    symbol = callback.data.split(":", 1)[1]
+    try:
+        text, keyboard = render_spot(await get_spot_ticker(symbol))
+        await callback.message.edit_text(
+            text,
+            reply_markup=keyboard,  # Сохраняем клавиатуру
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    except Exception as e:
+        logger.error(f"Error in spot_symbol_callback ({symbol}): {e}")
+        await callback.message.edit_text(f"⚠ Error: {str(e)}")
+
+
 @router.callback_query(F.data == "btcusdt")
 async def btcusdt_callback(callback: CallbackQuery):
     try:
-        # Запрашиваем тикеры для пары BTC/USDT
-        response = session.get_tickers(category="spot", symbol="BTCUSDT")
-        data = response['result']['list'][0]
-
-        # Извлекаем нужные данные
-        symbol = data['symbol']
-        last_price = data['lastPrice']
-        high_price = data['highPrice24h']
-        low_price = data['lowPrice24h']
-
-        # Формируем ответ
-        result = (
-            f"🟠 *{symbol}*\n"
-            f"💰 *Current price:* {last_price} USDT\n"
-            f"📈 *24h High:* {high_price} USDT\n"
-            f"📉 *24h Low:* {low_price} USDT"
-        )
+        # Запрашиваем тикеры для пары BTC/USDT и берем готовый ответ из кеша рендера
+        text, keyboard = render_spot(await get_spot_ticker("BTCUSDT"))
 
         # Редактируем сообщение, оставляя только результат и клавиатуру
         await callback.message.edit_text(
-            result,
-            reply_markup=get_inline_bybit_keyboard(),  # Сохраняем клавиатуру
+            text,
+            reply_markup=keyboard,  # Сохраняем клавиатуру
             parse_mode=ParseMode.MARKDOWN
         )
 
@@ -191,28 +687,13 @@ async def btcusdt_callback(callback: CallbackQuery):
 @router.callback_query(F.data == "ethusdt")
 async def ethusdt_callback(callback: CallbackQuery):
     try:
-        # Запрашиваем тикеры для пары ETH/USDT
-        response = session.get_tickers(category="spot", symbol="ETHUSDT")
-        data = response['result']['list'][0]
-
-        # Извлекаем нужные данные
-        symbol = data['symbol']
-        last_price = data['lastPrice']
-        high_price = data['highPrice24h']
-        low_price = data['lowPrice24h']
-
-        # Формируем ответ
-        result = (
-            f"🟠 *{symbol}*\n"
-            f"💰 *Current price:* {last_price} USDT\n"
-            f"📈 *24h High:* {high_price} USDT\n"
-            f"📉 *24h Low:* {low_price} USDT"
-        )
+        # Запрашиваем тикеры для пары ETH/USDT и берем готовый ответ из кеша рендера
+        text, keyboard = render_spot(await get_spot_ticker("ETHUSDT"))
 
         # Редактируем сообщение, оставляя только результат и клавиатуру
         await callback.message.edit_text(
-            result,
-            reply_markup=get_inline_bybit_keyboard(),  # Сохраняем клавиатуру
+            text,
+            reply_markup=keyboard,  # Сохраняем клавиатуру
             parse_mode=ParseMode.MARKDOWN
         )
 
@@ -220,124 +701,39 @@ async def ethusdt_callback(callback: CallbackQuery):
         logger.error(f"Error in ethusdt_callback: {e}")
         await callback.message.edit_text(f"⚠ Error: {str(e)}")
 
-# Добавьте этот код в ваш основной файл бота
-
 @router.inline_query()
 async def inline_mode_handler(inline_query: InlineQuery):
-    query = inline_query.query.lower()  # Получаем текст запроса
-
-    # Обработка запроса для BTC
-    if query == "btc":
-        try:
-            # Запрашиваем цену BTC (используем тот же код, что и для кнопки)
-            response = session.get_tickers(category="spot", symbol="BTCUSDT")
-            data = response['result']['list'][0]
-            symbol = data['symbol']
-            last_price = data['lastPrice']
-            high_price = data['highPrice24h']
-            low_price = data['lowPrice24h']
-
-            # Формируем ответ (тот же текст, что и для кнопки)
-            result_text = (
-                f"🟠 *{symbol}*\n"
-                f"💰 *Current price:* {last_price} USDT\n"
-                f"📈 *24h High:* {high_price} USDT\n"
-                f"📉 *24h Low:* {low_price} USDT"
-            )
-
-            # Создаем результат для inline-режима
-            result = InlineQueryResultArticle(
-                id="1",
-                title="💰 Текущая цена BTC",
-                input_message_content=InputTextMessageContent(
-                    message_text=result_text,
-                    parse_mode=ParseMode.MARKDOWN
-                ),
-                description=f"Цена BTC: {last_price} USDT",
-            )
-
-            # Отправляем результат
-            await inline_query.answer([result], cache_time=1)
-
-        except Exception as e:
-            logger.error(f"Error in inline BTC query: {e}")
-            await inline_query.answer(
-                [InlineQueryResultArticle(
-                    id="error",
-                    title="⚠ Ошибка",
-                    input_message_content=InputTextMessageContent(
-                        message_text="Произошла ошибка при получении цены BTC."
-                    )
-                )],
-                cache_time=1
-            )
-
-    # Обработка запроса для ETH
-    elif query == "eth":
-        try:
-            # Запрашиваем цену ETH (используем тот же код, что и для кнопки)
-            response = session.get_tickers(category="spot", symbol="ETHUSDT")
-            data = response['result']['list'][0]
-            symbol = data['symbol']
-            last_price = data['lastPrice']
-            high_price = data['highPrice24h']
-            low_price = data['lowPrice24h']
-
-            # Формируем ответ (тот же текст, что и для кнопки)
-            result_text = (
-                f"🟣 *{symbol}*\n"
-                f"💰 *Current price:* {last_price} USDT\n"
-                f"📈 *24h High:* {high_price} USDT\n"
-                f"📉 *24h Low:* {low_price} USDT"
-            )
-
-            # Создаем результат для inline-режима
-            result = InlineQueryResultArticle(
-                id="2",
-                title="💰 Текущая цена ETH",
-                input_message_content=InputTextMessageContent(
-                    message_text=result_text,
-                    parse_mode=ParseMode.MARKDOWN
-                ),
-                description=f"Цена ETH: {last_price} USDT",
-            )
-
-            # Отправляем результат
-            await inline_query.answer([result], cache_time=1)
-
-        except Exception as e:
-            logger.error(f"Error in inline ETH query: {e}")
-            await inline_query.answer(
-                [InlineQueryResultArticle(
-                    id="error",
-                    title="⚠ Ошибка",
-                    input_message_content=InputTextMessageContent(
-                        message_text="Произошла ошибка при получении цены ETH."
-                    )
-                )],
-                cache_time=1
-            )
-
-    # Если запрос не распознан
-    else:
+    try:
+        results, next_offset, cache_time = await inline_engine.answer(inline_query.query, inline_query.offset)
+    except Exception as e:
+        logger.error(f"Error in inline query: {e}")
         await inline_query.answer(
             [InlineQueryResultArticle(
-                id="unknown",
-                title="❌ Неизвестная команда",
+                id="error",
+                title="⚠ Ошибка",
                 input_message_content=InputTextMessageContent(
-                    message_text="Используйте `btc` или `eth` для получения цен."
+                    message_text="Произошла ошибка при получении цены."
                 )
             )],
             cache_time=1
         )
+        return
+
+    if not results and not inline_query.offset:
+        results = [InlineQueryResultArticle(
+            id="unknown",
+            title="❌ Ничего не найдено",
+            input_message_content=InputTextMessageContent(
+                message_text="Введите символ (например, `btc`, `solusdt`) или `usdt rub 5000`."
+            )
+        )]
+    await inline_query.answer(results, cache_time=cache_time, next_offset=next_offset)
 
 @router.callback_query(F.data == "usdtbuyrub")
 async def usdtbuyrub_callback(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
-        "Введите сумму рублей для покупки USDT (минимум 1000) might be delay 2-5sec:",
-        reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
-            [types.InlineKeyboardButton(text="Назад", callback_data="bybit")]
-        ])
+        "Введите сумму рублей для покупки USDT (минимум 1000):",
+        reply_markup=get_back_keyboard("bybit")
     )
     await state.set_state(Form.amount)
     await state.update_data(action="buy")
@@ -345,10 +741,8 @@ async def usdtbuyrub_callback(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "usdtrubsell")
 async def usdtrubsell_callback(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
-        "Введите сумму рублей для продажи USDT (минимум 1000) might be delay 2-5sec:",
-        reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
-            [types.InlineKeyboardButton(text="Назад", callback_data="bybit")]
-        ])
+        "Введите сумму рублей для продажи USDT (минимум 1000):",
+        reply_markup=get_back_keyboard("bybit")
     )
     await state.set_state(Form.amount)
     await state.update_data(action="sell")
@@ -358,60 +752,26 @@ async def process_amount(message: Message, state: FSMContext):
     try:
         amount = float(message.text)
         if amount < 1000:
-            await message.answer("Минимальная сумма 1000. Пожалуйста, введите сумму снова. might be delay 2-5sec")
+            await message.answer("Минимальная сумма 1000. Пожалуйста, введите сумму снова.")
             return
 
         data = await state.get_data()
         action = data.get("action")
 
-        url = "https://api2.bybit.com/fiat/otc/item/online"
-        side = "1" if action == "buy" else "0"
-
-        payload = {
-            "userId": "",
-            "tokenId": "USDT",
-            "currencyId": "RUB",
-            "payment": ["382", "581", "75"],
-            "side": side,
-            "size": "8",
-            "page": "1",
-            "amount": str(amount),
-            "vaMaker": False,
-            "bulkMaker": False,
-            "canTrade": True,
-            "verificationFilter": 0,
-            "sortType": "TRADE_PRICE",
-            "paymentPeriod": [],
-            "itemRegion": 1
-        }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload) as response:
-                result = await response.json()
-
-        prices = []
-        if 'result' in result and 'items' in result['result']:
-            items = result['result']['items']
-            for item in items:
-                price = float(item['price'])
-                prices.append(price)
-
-            max_price = max(prices)
-            min_price = min(prices)
-            avg_price = sum(prices) / len(prices)
-
-            result_text = (
-                f"✅ {action.upper()} Rate - USDT/RUB:\n"
-                f"📈 Max price: {max_price} ₽\n"
-                f"📉 Min price: {min_price} ₽\n"
-                f"📊 Average price: {avg_price:.2f} ₽"
-            )
+        # Берем снимок ближайшего уровня, если он есть, иначе запрашиваем Bybit P2P
+        snapshot = p2p_poller.get("bybit", action, amount)
+        if snapshot:
+            parsed_data, age, tier = snapshot
         else:
-            result_text = "Data not found or response structure is different."
+            parsed_data = await fetch_bybit_p2p(amount, action)
+
+        result_text, keyboard = render_bybit_p2p(action, parsed_data)
+        if snapshot:
+            result_text += f"\n\n{format_age(age)} (tier {tier:g} ₽)"
 
         await message.answer(
             result_text,
-            reply_markup=get_inline_bybit_keyboard()
+            reply_markup=keyboard
         )
         await state.clear()
 
@@ -438,16 +798,59 @@ async def handle_any_message(message: Message):
 
 
 # Функция запуска бота
-async def main():
-    # Устанавливаем команды меню
-    await set_bot_commands(bot)
+mark("handlers")
+
+
+def setup_quote_store():
+    """
+    Прогревает кеши котировок с диска до начала обработки обновлений
+    (QUOTE_CACHE_INTERVAL=0 - не сохранять и не загружать). Загружает снимок
+    каждый процесс, а сохраняет только основной: у него фоновый опрос бирж.
+    """
+    if quote_store.interval <= 0:
+        return
+    quote_store.load()
+    if PRIMARY:
+        dp.startup.register(quote_store.start)
+        dp.shutdown.register(quote_store.stop)
+    else:
+        quote_store.close()
 
+
+def setup_dispatcher():
     # Подключаем роутер Huobi
     dp.include_router(huobi_router)
 
     # Подключаем основной роутер
     dp.include_router(router)
 
+
+async def main():
+    sharded = BOT_MODE != "webhook" and WORKERS > 1
+    # При шардировании обновления обрабатывают воркеры: снимок кешей загружают они
+    if not sharded:
+        setup_quote_store()
+
+    # Устанавливаем команды меню
+    await set_bot_commands(bot)
+
+    # Подключаем роутеры
+    setup_dispatcher()
+
+    # Режим вебхука (BOT_MODE=webhook в .env)
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+
+        await run_webhook(dp, bot)
+        return
+
+    # Несколько процессов-воркеров с шардированием по id чата (WORKERS=N в .env)
+    if sharded:
+        from sharding import run_sharded_polling
+
+        await run_sharded_polling(bot, dp, WORKERS)
+        return
+
     # Удаляем вебхук (если был)
     await bot.delete_webhook(drop_pending_updates=True)
 
@@ -0,0 +1,140 @@
+import aiohttp
+from http_session import get_session
+from coalesce import p2p_coalescer, p2p_key
+from metrics import track_upstream
+from history import record_p2p
+from alerts import on_p2p_quote
+from fastjson import load_items
+from depth import fetch_book, DEPTH_PAGES
+from resilience import upstream
+
+# Адрес P2P API Bybit
+BYBIT_P2P_URL = "https://api2.bybit.com/fiat/otc/item/online"
+
+# Размер страницы стакана в режиме глубины
+BYBIT_DEPTH_PAGE_SIZE = 20
+
+# Таймаут на один запрос к Bybit P2P (в секундах)
+BYBIT_P2P_TIMEOUT = aiohttp.ClientTimeout(total=8, connect=3)
+
+
+async def get_bybit_p2p_data(amount: float, action: str = "buy", timeout: aiohttp.ClientTimeout = BYBIT_P2P_TIMEOUT,
+                             page: int = 1, size: int = 8):
+    """
+    Получает данные о P2P-предложениях USDT/RUB на Bybit.
+
+    :param amount: Сумма в рублях для фильтрации предложений (None - без фильтра).
+    :param action: Тип сделки ("buy" или "sell").
+    :param timeout: Таймаут запроса.
+    :param page: Номер страницы.
+    :param size: Количество предложений на странице.
+    :return: Тело ответа в байтах (разбирается в decode_bybit_p2p).
+    """
+    side = "1" if action == "buy" else "0"
+
+    payload = {
+        "userId": "",
+        "tokenId": "USDT",
+        "currencyId": "RUB",
+        "payment": ["382", "581", "75"],
+        "side": side,
+        "size": str(size),
+        "page": str(page),
+        "amount": str(amount) if amount is not None else "",
+        "vaMaker": False,
+        "bulkMaker": False,
+        "canTrade": True,
+        "verificationFilter": 0,
+        "sortType": "TRADE_PRICE",
+        "paymentPeriod": [],
+        "itemRegion": 1
+    }
+
+    session = get_session()
+    async with track_upstream("bybit_p2p"):
+        async with session.post(BYBIT_P2P_URL, json=payload, timeout=timeout) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+def decode_bybit_p2p(raw: bytes, limit: int = 8, mode: str = None):
+    """
+    Декодирует ответ Bybit и оставляет только нужные поля первых limit предложений.
+
+    :param raw: Тело ответа Bybit API.
+    :param limit: Сколько предложений разобрать.
+    :param mode: Режим разбора JSON ("full", "partial" или "auto", см. fastjson).
+    :return: Список предложений (price, quantity в USDT, min_amount, max_amount) или None, если в ответе нет списка.
+    """
+    _, items = load_items(raw, ("result", "items"), limit, mode)
+    if items is None:
+        return None
+    return [
+        {
+            "price": float(item["price"]),
+            "quantity": float(item.get("lastQuantity") or 0),
+            "min_amount": float(item.get("minAmount") or 0),
+            "max_amount": float(item.get("maxAmount") or 0),
+        }
+        for item in items
+    ]
+
+
+def parse_bybit_p2p_data(offers):
+    """
+    Парсит данные о P2P-предложениях Bybit.
+
+    :param offers: Предложения из decode_bybit_p2p.
+    :return: Словарь с минимальной, максимальной и средней ценой или None.
+    """
+    if not offers:
+        return None
+
+    prices = [offer['price'] for offer in offers]
+
+    return {
+        "min_price": min(prices),
+        "max_price": max(prices),
+        "avg_price": sum(prices) / len(prices)
+    }
+
+
+async def fetch_bybit_p2p(amount: float, action: str = "buy"):
+    """
+    Получает и сразу парсит P2P-данные Bybit.
+    Одновременные одинаковые запросы объединяются в один.
+
+    :return: Результат parse_bybit_p2p_data. Если Bybit недоступен и отдан
+             последний удачный ответ, в словаре есть поле stale_age.
+    """
+    key = p2p_key("bybit", action, amount)
+
+    async def attempt():
+        return parse_bybit_p2p_data(decode_bybit_p2p(await get_bybit_p2p_data(amount, action)))
+
+    async def request():
+        parsed, stale_age = await upstream("bybit_p2p").call(key, attempt)
+        if stale_age is not None:
+            return dict(parsed, stale_age=stale_age) if parsed else parsed
+        record_p2p("bybit_p2p", action, amount, parsed)
+        on_p2p_quote("bybit_p2p", action, parsed)
+        return parsed
+
+    return await p2p_coalescer.run(key, request)
+
+
+async def fetch_bybit_depth(amount: float, action: str = "buy", pages: int = DEPTH_PAGES):
+    """
+    Загружает несколько страниц стакана Bybit параллельно и симулирует
+    исполнение заявки на amount RUB.
+
+    :return: FillResult или None, если предложений нет.
+    """
+    async def fetch_page(page: int):
+        raw = await get_bybit_p2p_data(None, action, page=page, size=BYBIT_DEPTH_PAGE_SIZE)
+        return decode_bybit_p2p(raw, limit=BYBIT_DEPTH_PAGE_SIZE)
+
+    async def request():
+        return (await fetch_book(fetch_page, pages)).fill(amount)
+
+    return await p2p_coalescer.run(("depth",) + p2p_key("bybit", action, amount), request)
@@ -0,0 +1,271 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from aiogram.types import BufferedInputFile
+
+from coalesce import RequestCoalescer
+from metrics import track_upstream, record_cache
+from resilience import upstream, format_stale
+
+logger = logging.getLogger(__name__)
+
+# Интервалы графика: обозначение -> (интервал Bybit, длительность свечи в секундах)
+CHART_INTERVALS = {
+    "5m": ("5", 300),
+    "15m": ("15", 900),
+    "1h": ("60", 3600),
+    "4h": ("240", 14400),
+    "1d": ("D", 86400),
+}
+
+# Котируемые валюты, которые не нужно дописывать к символу
+QUOTE_SUFFIXES = ("USDT", "USDC", "BTC", "ETH")
+
+# Сколько закрытых свечей рисовать
+CHART_CANDLES = int(os.getenv('CHART_CANDLES', '96'))
+
+
+class ChartError(Exception):
+    """
+    Неверные аргументы /chart или нет данных для графика.
+    """
+
+
+def parse_chart_args(args: str):
+    """
+    Разбирает аргументы /chart: "BTCUSDT 1h", "eth 4h", "sol".
+
+    :return: Кортеж (символ, интервал).
+    :raises ChartError: если аргументы неверные.
+    """
+    parts = (args or "").split()
+    if not parts or len(parts) > 2:
+        raise ChartError("Формат: /chart BTCUSDT 1h")
+    symbol = parts[0].upper()
+    if not symbol.isalnum():
+        raise ChartError(f"Неверный символ: {parts[0]}")
+    if not symbol.endswith(QUOTE_SUFFIXES):
+        symbol += "USDT"
+    interval = parts[1].lower() if len(parts) > 1 else "1h"
+    if interval not in CHART_INTERVALS:
+        raise ChartError(f"Интервал должен быть одним из: {', '.join(CHART_INTERVALS)}")
+    return symbol, interval
+
+
+def _init_worker():
+    """
+    Инициализация процесса отрисовки: matplotlib импортируется один раз.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.figure  # noqa: F401
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def render_candles(title: str, starts, opens, highs, lows, closes, seconds: int):
+    """
+    Рисует свечной график в PNG (выполняется в процессе пула).
+
+    :param starts: Время открытия свечей (секунды, UTC), по возрастанию.
+    :param seconds: Длительность свечи (для подписей оси времени).
+    :return: PNG (bytes).
+    """
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    opens, highs, lows, closes = (np.asarray(v, dtype=float) for v in (opens, highs, lows, closes))
+    x = np.arange(len(closes))
+    colors = np.where(closes >= opens, "#26a69a", "#ef5350")
+
+    figure = Figure(figsize=(8, 4.5), dpi=100)
+    ax = figure.add_subplot()
+    ax.vlines(x, lows, highs, colors=colors, linewidth=0.8)
+    # Тело свечи не меньше 0.05% цены, чтобы доджи были видны
+    bodies = np.maximum(np.abs(closes - opens), closes * 0.0005)
+    ax.bar(x, bodies, bottom=np.minimum(opens, closes), width=0.7, color=colors)
+
+    label_format = "%d.%m" if seconds >= 86400 else "%d.%m %H:%M"
+    ticks = x[::max(1, len(x) // 6)]
+    ax.set_xticks(ticks)
+    ax.set_xticklabels([time.strftime(label_format, time.gmtime(starts[i])) for i in ticks], fontsize=8)
+    ax.yaxis.tick_right()
+    ax.grid(alpha=0.3)
+    ax.set_xlim(-1, len(x))
+    ax.set_title(f"{title}   last {closes[-1]:g}")
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class ChartEntry:
+    """
+    Готовый график: PNG до первой отправки, затем file_id Telegram.
+    """
+
+    __slots__ = ("png", "file_id", "caption")
+
+    def __init__(self, png: bytes, caption: str):
+        self.png = png
+        self.file_id = None
+        self.caption = caption
+
+
+class ChartService:
+    """
+    Свечные графики спотовых пар Bybit.
+
+    Свечи загружаются через сессию pybit, а отрисовка выполняется в пуле
+    процессов, поэтому matplotlib не блокирует цикл событий бота.
+    Графики кешируются по (символ, интервал, последняя закрытая свеча):
+    ключ вычисляется по текущему времени, так что повторный запрос не
+    обращается ни к бирже, ни к пулу. После первой отправки вместо PNG
+    используется file_id Telegram.
+    """
+
+    def __init__(self, session, workers: int = 2, candles: int = CHART_CANDLES, max_size: int = 256):
+        """
+        :param session: Сессия pybit (HTTP) для запросов к Bybit.
+        :param workers: Количество процессов отрисовки.
+        :param candles: Сколько закрытых свечей рисовать.
+        :param max_size: Сколько графиков хранить.
+        """
+        self.session = session
+        self.workers = workers
+        self.candles = candles
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (symbol, interval, start) -> ChartEntry
+        self._coalescer = RequestCoalescer()
+        self._executor = None
+        self._warm_up_task = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    async def start(self):
+        """
+        Запускает процессы отрисовки заранее (вызывается при запуске диспетчера).
+        """
+        # Процессы создаются сразу (при fork - пока в боте нет рабочих потоков),
+        # а загрузку matplotlib в них не ждем, чтобы не задерживать запуск бота
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        warm_up = [loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)]
+        self._warm_up_task = asyncio.create_task(self._wait_warm_up(warm_up))
+
+    async def _wait_warm_up(self, warm_up):
+        try:
+            await asyncio.gather(*warm_up)
+            logger.info(f"Chart workers ready: {self.workers}")
+        except Exception as e:
+            logger.error(f"Chart workers failed to start: {e!r}")
+
+    async def stop(self):
+        """
+        Останавливает процессы отрисовки (вызывается при остановке диспетчера).
+        """
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            await asyncio.gather(self._warm_up_task, return_exceptions=True)
+            self._warm_up_task = None
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+    @staticmethod
+    def last_closed(seconds: int, now: float = None):
+        """
+        Время открытия последней закрытой свечи (свечи Bybit выровнены по UTC).
+        """
+        now = time.time() if now is None else now
+        return int(now // seconds) * seconds - seconds
+
+    def _fetch_klines(self, symbol: str, interval: str):
+        """
+        Блокирующий запрос свечей через pybit (выполняется в отдельном потоке).
+        """
+        response = self.session.get_kline(
+            category="spot", symbol=symbol, interval=CHART_INTERVALS[interval][0], limit=self.candles + 1)
+        return response['result']['list']
+
+    async def _klines(self, symbol: str, interval: str):
+        async def fetch():
+            async with track_upstream("bybit_spot"):
+                return await asyncio.to_thread(self._fetch_klines, symbol, interval)
+
+        return await upstream("bybit_spot").call(("kline", symbol, interval), fetch)
+
+    async def _render(self, symbol: str, interval: str, start: int):
+        rows, stale_age = await self._klines(symbol, interval)
+        # Bybit отдает свечи от новой к старой; текущая (незакрытая) отбрасывается
+        seconds = CHART_INTERVALS[interval][1]
+        closed = [row for row in rows if int(row[0]) // 1000 <= start][:self.candles]
+        if not closed:
+            raise ChartError(f"Нет свечей для {symbol}")
+        closed.reverse()
+        columns = list(zip(*closed))
+        png = await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), render_candles,
+            f"{symbol} · {interval}", [int(v) // 1000 for v in columns[0]],
+            *([float(v) for v in column] for column in columns[1:5]), seconds,
+        )
+        return ChartEntry(png, f"📈 {symbol} · {interval} (Bybit spot)"), stale_age
+
+    async def get(self, symbol: str, interval: str):
+        """
+        Возвращает график из кеша или строит его.
+
+        :return: Кортеж (ChartEntry, возраст свечей или None). Построенный по
+                 сохраненным свечам график не кешируется.
+        :raises ChartError: если свечей нет.
+        :raises UpstreamUnavailable: если Bybit недоступен.
+        """
+        key = (symbol, interval, self.last_closed(CHART_INTERVALS[interval][1]))
+        entry = self._entries.get(key)
+        record_cache("chart", entry is not None)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry, None
+
+        entry, stale_age = await self._coalescer.run(key, lambda: self._render(symbol, interval, key[2]))
+        if stale_age is None:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry, stale_age
+
+    async def send(self, message, symbol: str, interval: str, reply_markup=None):
+        """
+        Отправляет график в чат сообщения: по file_id, если он уже загружался.
+        """
+        entry, stale_age = await self.get(symbol, interval)
+        caption = entry.caption
+        if stale_age is not None:
+            caption = f"{caption}\n{format_stale(stale_age)}"
+        if entry.file_id is not None:
+            return await message.answer_photo(entry.file_id, caption=caption, reply_markup=reply_markup)
+
+        sent = await message.answer_photo(
+            BufferedInputFile(entry.png, filename=f"{symbol}_{interval}.png"),
+            caption=caption, reply_markup=reply_markup,
+        )
+        if getattr(sent, "photo", None):
+            entry.file_id = sent.photo[-1].file_id
+            entry.png = None  # Дальше отправляем по file_id
+        return sent
@@ -0,0 +1,82 @@
+import asyncio
+
+from metrics import registry
+
+
+class RequestCoalescer:
+    """
+    Реестр выполняющихся запросов к биржам.
+
+    Одновременные одинаковые запросы (по ключу) не дублируются: первый
+    выполняет запрос, остальные ждут его общий результат.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Future
+        self.calls = 0  # Сколько запросов реально ушло на биржу
+        self.coalesced = 0  # Сколько запросов было объединено с уже выполняющимися
+
+    async def run(self, key, factory):
+        """
+        Выполняет запрос или присоединяется к уже выполняющемуся с тем же ключом.
+
+        :param key: Ключ запроса, например ("bybit", "buy", 5000.0).
+        :param factory: Функция без аргументов, возвращающая корутину запроса.
+        :return: Результат запроса.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.calls += 1
+        try:
+            result = await factory()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение как полученное, если никто больше не ждет
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self):
+        """
+        Возвращает счетчики объединения запросов.
+        """
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+
+def p2p_key(venue: str, side: str, amount: float):
+    """
+    Ключ P2P-запроса с нормализованной суммой ("5000", "5000.0" и "5000.001" совпадают).
+    """
+    return venue, side, round(float(amount), 2)
+
+
+# Общий реестр для P2P-запросов всех площадок
+p2p_coalescer = RequestCoalescer()
+
+
+def _coalescer_metrics():
+    stats = p2p_coalescer.stats()
+    return [
+        "# TYPE bot_p2p_upstream_calls_total counter",
+        f"bot_p2p_upstream_calls_total {stats['calls']}",
+        "# TYPE bot_p2p_coalesced_total counter",
+        f"bot_p2p_coalesced_total {stats['coalesced']}",
+    ]
+
+
+registry.add_collector(_coalescer_metrics)
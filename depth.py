@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# Сколько страниц стакана P2P загружать и сколько ждать их в сумме (настраивается через .env)
+DEPTH_PAGES = int(os.getenv('P2P_DEPTH_PAGES', '5'))
+DEPTH_DEADLINE = float(os.getenv('P2P_DEPTH_DEADLINE', '3'))
+
+
+class OfferBook:
+    """
+    Стакан P2P-предложений в параллельных массивах array('d').
+
+    Порядок предложений - как у площадки (лучшая цена первой), поэтому
+    страницы добавляются по очереди.
+    """
+
+    __slots__ = ("prices", "quantities", "min_limits", "max_limits")
+
+    def __init__(self):
+        self.prices = array("d")
+        self.quantities = array("d")  # Доступный объем в USDT
+        self.min_limits = array("d")  # Лимиты сделки в фиате
+        self.max_limits = array("d")
+
+    def extend(self, offers):
+        """
+        Добавляет предложения из decode_*_p2p (price, quantity, min_amount, max_amount).
+        """
+        for offer in offers:
+            self.prices.append(offer["price"])
+            self.quantities.append(offer["quantity"])
+            self.min_limits.append(offer["min_amount"])
+            self.max_limits.append(offer["max_amount"])
+
+    def __len__(self):
+        return len(self.prices)
+
+    def fill(self, amount: float):
+        """
+        Симулирует исполнение заявки на amount фиата по стакану: берет
+        предложения по очереди, пока сумма не набрана. Предложение пропускается,
+        если сумма, которую по нему можно взять (остаток, ограниченный объемом
+        и максимальным лимитом), меньше его минимального лимита.
+
+        :return: FillResult или None, если стакан пуст.
+        """
+        if not self.prices:
+            return None
+        remaining = amount
+        usdt = 0.0
+        used = 0
+        for price, quantity, min_limit, max_limit in zip(
+                self.prices, self.quantities, self.min_limits, self.max_limits):
+            if remaining <= 0:
+                break
+            # Сколько фиата принимает предложение: лимит и доступный объем
+            capacity = quantity * price if quantity else max_limit
+            if max_limit:
+                capacity = min(capacity, max_limit)
+            take = min(remaining, capacity)
+            if take <= 0 or take < min_limit:
+                continue
+            usdt += take / price
+            remaining -= take
+            used += 1
+        return FillResult(amount, amount - remaining, usdt, self.prices[0], used, len(self.prices))
+
+
+class FillResult:
+    """
+    Результат симуляции исполнения заявки по стакану.
+    """
+
+    __slots__ = ("amount", "filled", "usdt", "best_price", "offers_used", "depth")
+
+    def __init__(self, amount: float, filled: float, usdt: float, best_price: float, offers_used: int, depth: int):
+        self.amount = amount
+        self.filled = filled  # Сколько фиата удалось разместить
+        self.usdt = usdt  # Сколько USDT получено или продано
+        self.best_price = best_price
+        self.offers_used = offers_used
+        self.depth = depth  # Сколько предложений было в стакане
+
+    @property
+    def effective_price(self):
+        """
+        Средневзвешенная по объему цена исполнения.
+        """
+        return self.filled / self.usdt if self.usdt else None
+
+    @property
+    def slippage(self):
+        """
+        Отклонение эффективной цены от лучшей, в процентах (всегда >= 0).
+        """
+        if not self.usdt:
+            return None
+        return abs(self.effective_price - self.best_price) / self.best_price * 100
+
+    @property
+    def fill_ratio(self):
+        return self.filled / self.amount if self.amount else 0.0
+
+
+async def fetch_book(fetch_page, pages: int = DEPTH_PAGES, deadline: float = DEPTH_DEADLINE):
+    """
+    Загружает страницы стакана параллельно и ждет их не дольше deadline.
+
+    В стакан попадают только страницы подряд начиная с первой: если
+    промежуточная страница не успела, более глубокие не используются,
+    чтобы не пропустить предложения между ними.
+
+    :param fetch_page: Асинхронная функция fetch_page(page) -> список предложений.
+    :return: OfferBook.
+    :raises Exception: если не загрузилась первая страница.
+    """
+    tasks = [asyncio.create_task(fetch_page(page)) for page in range(1, pages + 1)]
+    try:
+        await asyncio.wait(tasks, timeout=deadline)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    book = OfferBook()
+    for page, task in enumerate(tasks, start=1):
+        if task.cancelled() or task.exception() is not None:
+            if page == 1:
+                if task.cancelled():
+                    raise asyncio.TimeoutError("P2P depth: first page timed out")
+                raise task.exception()
+            logger.warning(f"P2P depth: page {page} unavailable, using {page - 1} pages")
+            break
+        offers = task.result()
+        if not offers:
+            break
+        book.extend(offers)
+    return book
+
+
+def format_fill(title: str, currency: str, result: FillResult):
+    """
+    Текст ответа /depth.
+    """
+    if result is None or not result.usdt:
+        return f"{title}\n\n❌ Нет предложений для этой суммы."
+    lines = [
+        title,
+        "",
+        f"💵 Сумма: {result.amount:,.0f} {currency}",
+        f"🎯 Эффективная цена: {result.effective_price:.2f} {currency}",
+        f"🏷 Лучшая цена: {result.best_price:.2f} {currency}",
+        f"📉 Проскальзывание: {result.slippage:.2f}%",
+        f"🪙 Объем: {result.usdt:,.2f} USDT",
+        f"📚 Предложений: {result.offers_used} из {result.depth}",
+    ]
+    if result.fill_ratio < 1:
+        lines.append(f"⚠ Глубины хватает на {result.fill_ratio * 100:.0f}% суммы")
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+import json
+import os
+import re
+
+# orjson - необязательная зависимость: если ее нет, используется стандартный json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Режим разбора P2P-ответов: "full" - декодировать весь ответ, "partial" - только
+# первые N предложений, "auto" - partial для больших ответов, full для остальных
+P2P_JSON_MODE = os.getenv('P2P_JSON_MODE', 'auto')
+
+# С какого размера ответа частичный разбор выгоднее полного (и stdlib, и orjson):
+# каждое предложение декодируется отдельным вызовом, поэтому на коротких
+# ответах он медленнее (см. bench_json.py)
+PARTIAL_MIN_SIZE = 32 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+def loads(data):
+    """
+    Декодирует JSON из bytes или str быстрым бэкендом, если он установлен.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def resolve_mode(mode: str = None, size: int = 0):
+    """
+    Возвращает фактический режим разбора ("full" или "partial").
+
+    :param size: Размер ответа в байтах (для режима auto).
+    """
+    mode = mode or P2P_JSON_MODE
+    if mode == "auto":
+        return "partial" if size >= PARTIAL_MIN_SIZE else "full"
+    return mode
+
+
+def _skip(text: str, pos: int):
+    return _whitespace.match(text, pos).end()
+
+
+def _scan_object(text: str, pos: int, path, limit: int, fields: dict):
+    """
+    Проходит объект, начинающийся в text[pos] == "{", до ключа path[0].
+    Значения других ключей декодируются и сохраняются в fields.
+
+    :return: Список элементов массива или None, если ключа нет.
+    """
+    if text[pos] != "{":
+        raise ValueError("object expected")
+    pos = _skip(text, pos + 1)
+    while text[pos] != "}":
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _skip(text, pos)
+        if text[pos] != ":":
+            raise ValueError("':' expected")
+        pos = _skip(text, pos + 1)
+        if key == path[0]:
+            if len(path) > 1:
+                return _scan_object(text, pos, path[1:], limit, fields)
+            return _scan_array(text, pos, limit)
+        fields[key], pos = _decoder.raw_decode(text, pos)
+        pos = _skip(text, pos)
+        if text[pos] == ",":
+            pos = _skip(text, pos + 1)
+    return None
+
+
+def _scan_array(text: str, pos: int, limit: int):
+    if text[pos] != "[":
+        # null или другое значение вместо списка
+        return None
+    items = []
+    pos = _skip(text, pos + 1)
+    while text[pos] != "]" and len(items) < limit:
+        item, pos = _decoder.raw_decode(text, pos)
+        items.append(item)
+        pos = _skip(text, pos)
+        if text[pos] == ",":
+            pos = _skip(text, pos + 1)
+    return items
+
+
+def load_partial(data, path, limit: int):
+    """
+    Частичный разбор: декодирует только первые limit элементов массива по пути
+    path (например ("result", "items")) и остальную часть JSON не трогает.
+    Скалярные поля, встреченные по пути до массива (code, message и т.п.),
+    возвращаются отдельно.
+
+    :return: Кортеж (поля, элементы). Элементы равны None, если массива нет.
+    :raises ValueError: если JSON некорректен.
+    """
+    text = data.decode("utf-8") if isinstance(data, (bytes, bytearray)) else data
+    fields = {}
+    try:
+        items = _scan_object(text, _skip(text, 0), tuple(path), limit, fields)
+    except IndexError:
+        raise ValueError("unexpected end of JSON")
+    return fields, items
+
+
+def load_items(data, path, limit: int, mode: str = None):
+    """
+    Возвращает поля верхних уровней и первые limit элементов массива по пути path
+    в режиме full или partial.
+
+    :return: Кортеж (поля, элементы) как у load_partial.
+    """
+    if resolve_mode(mode, len(data)) == "partial":
+        try:
+            return load_partial(data, path, limit)
+        except ValueError:
+            # Неожиданная структура - разбираем ответ целиком
+            pass
+    document = loads(data)
+    fields = {}
+    node = document
+    for key in path:
+        if not isinstance(node, dict):
+            return fields, None
+        fields.update((k, v) for k, v in node.items() if k != key)
+        node = node.get(key)
+    if not isinstance(node, list):
+        return fields, None
+    return fields, node[:limit]
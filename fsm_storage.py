@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в локальном файле SQLite.
+
+    Состояния и данные (menu_message_id, action, stars_ratio и т.д.) переживают
+    перезапуск бота. Запросы к базе выполняются в отдельном потоке.
+    """
+
+    def __init__(self, path: str = "fsm.sqlite3"):
+        """
+        :param path: Путь к файлу базы данных.
+        """
+        self.path = path
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._lock = asyncio.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT)"
+        )
+        self._conn.commit()
+
+    def _execute(self, query: str, params: tuple = (), fetch: bool = False):
+        cursor = self._conn.execute(query, params)
+        if fetch:
+            return cursor.fetchone()
+        self._conn.commit()
+        return None
+
+    async def _run(self, query: str, params: tuple = (), fetch: bool = False):
+        async with self._lock:
+            return await asyncio.to_thread(self._execute, query, params, fetch)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(
+            "INSERT INTO fsm (key, state, data) VALUES (?, ?, '{}') "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (self.key_builder.build(key), value),
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._run("SELECT state FROM fsm WHERE key = ?", (self.key_builder.build(key),), fetch=True)
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._run(
+            "INSERT INTO fsm (key, state, data) VALUES (?, NULL, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (self.key_builder.build(key), json.dumps(dict(data))),
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._run("SELECT data FROM fsm WHERE key = ?", (self.key_builder.build(key),), fetch=True)
+        return json.loads(row[0]) if row and row[0] else {}
+
+    async def close(self) -> None:
+        async with self._lock:
+            await asyncio.to_thread(self._conn.close)
+
+
+def create_storage():
+    """
+    Создает хранилище FSM по настройкам из .env:
+
+    FSM_STORAGE - "memory" (по умолчанию), "redis" или "sqlite";
+    REDIS_URL - адрес Redis (или совместимого сервера) для режима "redis";
+    FSM_SQLITE_PATH - путь к файлу базы для режима "sqlite".
+
+    :return: Экземпляр хранилища aiogram.
+    """
+    backend = os.getenv('FSM_STORAGE', 'memory')
+    if backend == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(
+            os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+            key_builder=DefaultKeyBuilder(with_destiny=True),
+        )
+    if backend == 'sqlite':
+        return SQLiteStorage(os.getenv('FSM_SQLITE_PATH', 'fsm.sqlite3'))
+    return MemoryStorage()
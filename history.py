@@ -0,0 +1,310 @@
+import logging
+import os
+import re
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Формат одной записи временного ряда
+SAMPLE_DTYPE = np.dtype([
+    ("ts", "f8"),  # Unix-время получения котировки (у прореженной записи - первой из объединенных)
+    ("min", "f8"),
+    ("avg", "f8"),
+    ("max", "f8"),
+    ("alipay", "f4"),  # Доля предложений с Alipay (только Huobi)
+    ("wechat", "f4"),  # Доля предложений с WeChat (только Huobi)
+    ("n", "u4"),  # Сколько исходных котировок объединено в записи
+])
+
+# Сумма P2P-запроса, котировки которой пишутся в историю (должна быть среди уровней
+# фонового опроса). Цены для разных сумм не смешиваются в одном ряду.
+HISTORY_P2P_AMOUNTS = {
+    "bybit_p2p": float(os.getenv('HISTORY_BYBIT_P2P_AMOUNT', '5000')),
+    "htx_p2p": float(os.getenv('HISTORY_HTX_P2P_AMOUNT', '1000')),
+}
+
+# Ряды, доступные в /history: алиас -> (площадка, сторона, описание, валюта)
+HISTORY_SERIES = {
+    "btc": ("bybit_spot", "BTCUSDT", "Bybit BTC/USDT", "USDT"),
+    "eth": ("bybit_spot", "ETHUSDT", "Bybit ETH/USDT", "USDT"),
+    "rubbuy": ("bybit_p2p", "buy", f"Bybit P2P USDT/RUB Buy ({HISTORY_P2P_AMOUNTS['bybit_p2p']:g} ₽)", "₽"),
+    "rubsell": ("bybit_p2p", "sell", f"Bybit P2P USDT/RUB Sell ({HISTORY_P2P_AMOUNTS['bybit_p2p']:g} ₽)", "₽"),
+    "cnybuy": ("htx_p2p", "buy", f"Huobi P2P USDT/CNY Buy ({HISTORY_P2P_AMOUNTS['htx_p2p']:g} CNY)", "CNY"),
+    "cnysell": ("htx_p2p", "sell", f"Huobi P2P USDT/CNY Sell ({HISTORY_P2P_AMOUNTS['htx_p2p']:g} CNY)", "CNY"),
+}
+
+# Спотовые пары, которые пишутся в историю (только те, что доступны в /history)
+HISTORY_SPOT_SYMBOLS = {side for venue, side, _, _ in HISTORY_SERIES.values() if venue == "bybit_spot"}
+
+_PERIOD_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+class Series:
+    """
+    Один временной ряд в файле, отображенном в память (np.memmap).
+
+    Записи упорядочены по времени, поэтому поиск по диапазону - бинарный
+    (np.searchsorted). Когда файл заполняется, записи старше срока хранения
+    удаляются, а старые записи объединяются в интервалы фиксированной
+    длины: 2 * срок хранения / capacity, так что весь срок хранения
+    занимает не больше половины файла. Объединенная запись помнит
+    количество исходных котировок (n): средние взвешиваются по нему, а
+    время записи - время первой из котировок, поэтому запрос диапазона
+    не захватывает данные раньше его начала.
+
+    Писать в файл может только один процесс. Ряд только для чтения
+    (readonly) видит записи пишущего процесса через общее отображение
+    и пересчитывает их количество при каждом чтении.
+    """
+
+    def __init__(self, path: str, capacity: int, retention: float, min_interval: float, readonly: bool = False):
+        self.path = path
+        self.capacity = capacity
+        self.retention = retention
+        self.min_interval = min_interval
+        self.readonly = readonly
+        self.bucket = 2 * retention / capacity  # Длина интервала прореживания в секундах
+        if readonly:
+            self._data = np.lib.format.open_memmap(path, mode="r")
+        else:
+            if os.path.exists(path):
+                self._migrate(path, capacity)
+            mode = "r+" if os.path.exists(path) else "w+"
+            self._data = np.lib.format.open_memmap(path, mode=mode, dtype=SAMPLE_DTYPE, shape=(capacity,))
+        # Незаполненные записи имеют ts = 0 и находятся в конце файла
+        self.count = int(np.count_nonzero(self._data["ts"]))
+
+    @staticmethod
+    def _migrate(path: str, capacity: int):
+        """
+        Переводит файл старого формата (без поля n) в SAMPLE_DTYPE: каждая
+        старая запись считается одной котировкой. Файл заменяется атомарно.
+        """
+        old = np.load(path, mmap_mode="r")
+        if old.dtype == SAMPLE_DTYPE:
+            return
+        count = int(np.count_nonzero(old["ts"]))
+        data = np.zeros(max(capacity, count), dtype=SAMPLE_DTYPE)
+        for name in old.dtype.names:
+            if name in SAMPLE_DTYPE.names:
+                data[name][:count] = old[name][:count]
+        data["n"][:count] = 1
+        del old
+        np.save(path + ".tmp.npy", data)
+        os.replace(path + ".tmp.npy", path)
+        logger.info(f"History series {path} migrated to the weighted format")
+
+    def append(self, ts: float, min_price: float, avg_price: float, max_price: float,
+               alipay: float = np.nan, wechat: float = np.nan):
+        """
+        Добавляет запись. Записи чаще min_interval секунд пропускаются.
+
+        :return: True, если запись добавлена.
+        """
+        if self.count and ts - self._data["ts"][self.count - 1] < self.min_interval:
+            return False
+        if self.count >= self.capacity:
+            self._compact(ts)
+        self._data[self.count] = (ts, min_price, avg_price, max_price, alipay, wechat, 1)
+        self.count += 1
+        return True
+
+    def _compact(self, now: float):
+        """
+        Удаляет записи старше срока хранения, а все записи, кроме последней
+        четверти, объединяет в интервалы фиксированной длины (bucket). Средние
+        взвешиваются по количеству котировок в записях.
+        """
+        data = self._data[:self.count]
+        data = data[int(np.searchsorted(data["ts"], now - self.retention)):]
+        recent = max(1, self.capacity // 4)
+        old, rest = data[:-recent], data[-recent:]
+        if len(old):
+            keys = np.floor(old["ts"] / self.bucket).astype(np.int64)
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            weights = old["n"].astype(np.float64)
+            total = np.add.reduceat(weights, starts)
+            merged = np.empty(len(starts), dtype=SAMPLE_DTYPE)
+            merged["ts"] = old["ts"][starts]
+            merged["min"] = np.minimum.reduceat(old["min"], starts)
+            merged["max"] = np.maximum.reduceat(old["max"], starts)
+            merged["avg"] = np.add.reduceat(old["avg"] * weights, starts) / total
+            merged["alipay"] = np.add.reduceat(old["alipay"] * weights, starts) / total
+            merged["wechat"] = np.add.reduceat(old["wechat"] * weights, starts) / total
+            merged["n"] = total
+            kept = np.concatenate([merged, rest])
+        else:
+            kept = rest.copy()
+        self._data[:len(kept)] = kept
+        self._data[len(kept):self.count] = np.zeros(self.count - len(kept), dtype=SAMPLE_DTYPE)
+        self.count = len(kept)
+
+    def range(self, start: float, end: float = None):
+        """
+        Возвращает записи с start <= ts <= end (бинарный поиск, O(log n)).
+        """
+        if self.readonly:
+            self.count = int(np.count_nonzero(self._data["ts"]))
+        ts = self._data["ts"][:self.count]
+        lo = int(np.searchsorted(ts, start, side="left"))
+        hi = self.count if end is None else int(np.searchsorted(ts, end, side="right"))
+        return self._data[lo:hi]
+
+    def flush(self):
+        if not self.readonly:
+            self._data.flush()
+
+
+class HistoryStore:
+    """
+    Хранилище временных рядов котировок: по одному файлу на (площадка, сторона).
+
+    При шардировании пишет только основной процесс (см. setup), остальные
+    воркеры открывают файлы только для чтения и отвечают на /history.
+    """
+
+    def __init__(self, directory: str = "history", capacity: int = 20000,
+                 retention: float = 30 * 86400, min_interval: float = 10.0):
+        """
+        :param directory: Каталог для файлов рядов.
+        :param capacity: Максимальное количество записей в одном ряду.
+        :param retention: Срок хранения записей в секундах.
+        :param min_interval: Минимальный интервал между записями одного ряда в секундах.
+        """
+        self.directory = directory
+        self.capacity = capacity
+        self.retention = retention
+        self.min_interval = min_interval
+        self.writable = True
+        self._series = {}
+
+    def setup(self, dp, primary: bool = True):
+        """
+        Подключает сброс рядов на диск при остановке диспетчера.
+
+        :param primary: Писать котировки в этом процессе (при шардировании - только в одном воркере).
+        """
+        self.writable = primary
+        dp.shutdown.register(self.close)
+
+    def series(self, venue: str, side: str):
+        """
+        Возвращает ряд; None, если хранилище только для чтения, а файла ряда еще нет
+        (или основной процесс еще не перевел его в текущий формат).
+        """
+        key = (venue, side)
+        series = self._series.get(key)
+        if series is None:
+            path = os.path.join(self.directory, f"{venue}_{side}.npy")
+            if not self.writable:
+                if not os.path.exists(path):
+                    return None
+                series = Series(path, self.capacity, self.retention, self.min_interval, readonly=True)
+                if series._data.dtype != SAMPLE_DTYPE:
+                    return None
+                self._series[key] = series
+                return series
+            os.makedirs(self.directory, exist_ok=True)
+            series = self._series[key] = Series(path, self.capacity, self.retention, self.min_interval)
+        return series
+
+    def record(self, venue: str, side: str, min_price: float, avg_price: float, max_price: float,
+               alipay: float = np.nan, wechat: float = np.nan, ts: float = None):
+        """
+        Записывает котировку. Ошибки записи не должны мешать ответу пользователю.
+        """
+        if not self.writable:
+            return
+        try:
+            self.series(venue, side).append(
+                time.time() if ts is None else ts, min_price, avg_price, max_price, alipay, wechat)
+        except Exception as e:
+            logger.error(f"History record error ({venue} {side}): {e}")
+
+    def flush(self):
+        for series in self._series.values():
+            series.flush()
+
+    async def close(self):
+        """
+        Сбрасывает ряды на диск (вызывается при остановке диспетчера).
+        """
+        self.flush()
+
+
+def record_ticker(data: dict):
+    """
+    Записывает спотовый тикер Bybit (low/last/high).
+    Пишутся только пары из HISTORY_SPOT_SYMBOLS: файл ряда занимает место на
+    диске и держится открытым, а остальные пары нельзя запросить в /history.
+    """
+    if data["symbol"] not in HISTORY_SPOT_SYMBOLS:
+        return
+    history_store.record("bybit_spot", data["symbol"], float(data["lowPrice24h"]),
+                         float(data["lastPrice"]), float(data["highPrice24h"]))
+
+
+def record_p2p(venue: str, side: str, amount: float, parsed: dict, offers: int = 10):
+    """
+    Записывает распарсенный P2P-снимок (min/avg/max и доли Alipay/WeChat).
+    Пишутся только снимки для суммы из HISTORY_P2P_AMOUNTS.
+    """
+    if not parsed or amount is None or float(amount) != HISTORY_P2P_AMOUNTS.get(venue):
+        return
+    history_store.record(
+        venue, side, parsed["min_price"], parsed["avg_price"], parsed["max_price"],
+        parsed.get("alipay_count", np.nan) / offers, parsed.get("wechat_count", np.nan) / offers,
+    )
+
+
+def parse_period(value: str):
+    """
+    Парсит период вида "30m", "6h", "7d" в секунды или возвращает None.
+    """
+    match = re.fullmatch(r"(\d+)([mhd])", value.strip().lower())
+    if not match:
+        return None
+    return int(match.group(1)) * _PERIOD_UNITS[match.group(2)]
+
+
+def format_history(alias: str, period: float, points: int = 8):
+    """
+    Формирует ответ на /history по ряду и периоду.
+
+    :param alias: Алиас ряда из HISTORY_SERIES.
+    :param period: Период в секундах.
+    :param points: Сколько точек показать в таблице.
+    """
+    venue, side, title, currency = HISTORY_SERIES[alias]
+    series = history_store.series(venue, side)
+    samples = series.range(time.time() - period) if series is not None else []
+    if len(samples) == 0:
+        return f"📈 *{title}*\n\nНет данных за этот период."
+
+    first, last = samples[0], samples[-1]
+    change = (last["avg"] - first["avg"]) / first["avg"] * 100 if first["avg"] else 0.0
+    lines = [
+        f"📈 *{title}*",
+        f"🕒 Записей: {len(samples)}",
+        f"📉 Min: {samples['min'].min():g} {currency}",
+        f"📈 Max: {samples['max'].max():g} {currency}",
+        f"📊 Avg: {np.average(samples['avg'], weights=samples['n']):.2f} {currency}",
+        f"🔁 Изменение: {change:+.2f}%",
+        "```",
+    ]
+    for index in np.unique(np.linspace(0, len(samples) - 1, min(points, len(samples))).astype(int)):
+        sample = samples[index]
+        lines.append(f"{time.strftime('%d.%m %H:%M', time.localtime(sample['ts']))}  {sample['avg']:.2f}")
+    lines.append("```")
+    return "\n".join(lines)
+
+
+# Общее хранилище (каталог и параметры настраиваются через .env)
+history_store = HistoryStore(
+    directory=os.getenv('HISTORY_DIR', 'history'),
+    capacity=int(os.getenv('HISTORY_CAPACITY', '20000')),
+    retention=float(os.getenv('HISTORY_RETENTION_DAYS', '30')) * 86400,
+    min_interval=float(os.getenv('HISTORY_MIN_INTERVAL', '10')),
+)
@@ -0,0 +1,62 @@
+import os
+import aiohttp
+
+# Таймауты по умолчанию для запросов к биржам (в секундах)
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=5)
+
+# Общая сессия aiohttp для всех запросов к биржам
+_session = None
+
+
+def _create_connector():
+    """
+    Создает пул соединений с keep-alive и кешированием DNS.
+    Настройки читаются из .env при создании сессии.
+    """
+    return aiohttp.TCPConnector(
+        limit=int(os.getenv('HTTP_POOL_LIMIT', '100')),  # Всего соединений
+        limit_per_host=int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '20')),  # Соединений на одну биржу
+        ttl_dns_cache=int(os.getenv('HTTP_DNS_CACHE_TTL', '300')),  # Время кеширования DNS
+        use_dns_cache=True,
+        keepalive_timeout=float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30')),  # Время жизни keep-alive соединения
+        enable_cleanup_closed=True,
+    )
+
+
+def get_session():
+    """
+    Возвращает общую сессию aiohttp, создавая ее при первом обращении.
+
+    :return: Экземпляр aiohttp.ClientSession.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(connector=_create_connector(), timeout=DEFAULT_TIMEOUT)
+    return _session
+
+
+async def open_session():
+    """
+    Открывает общую сессию заранее (вызывается при запуске диспетчера).
+    """
+    get_session()
+
+
+async def close_session():
+    """
+    Закрывает общую сессию aiohttp (вызывается при остановке бота).
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def setup_session(dp):
+    """
+    Привязывает жизненный цикл общей сессии к запуску и остановке диспетчера.
+
+    :param dp: Диспетчер aiogram.
+    """
+    dp.startup.register(open_session)
+    dp.shutdown.register(close_session)
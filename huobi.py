@@ -1,43 +1,64 @@
-import requests
+import aiohttp
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 from aiogram import Router, F
-from keyboards import get_inline_huobi_keyboard, get_main_menu_keyboard
+from keyboards import get_inline_huobi_keyboard
+from http_session import get_session
+from p2p_poller import p2p_poller, format_age
+from coalesce import p2p_coalescer, p2p_key
+from metrics import track_upstream
+from history import record_p2p
+from alerts import on_p2p_quote
+from render import render_huobi_p2p
+from fastjson import load_items
+from depth import fetch_book, DEPTH_PAGES
+from resilience import upstream
 
 # Создаем роутер для Huobi
 huobi_router = Router()
 
+# Адрес P2P API Huobi (HTX)
+HUOBI_P2P_URL = "https://www.htx.com/-/x/otc/v1/data/trade-market"
+
 # User-Agent для запросов к Huobi
 HUOBI_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/118.0"
 
+# Количество предложений на странице ответа Huobi
+HUOBI_PAGE_SIZE = 10
+
+# Таймаут на один запрос к Huobi (в секундах)
+HUOBI_TIMEOUT = aiohttp.ClientTimeout(total=8, connect=3)
+
 # Создаем класс состояний
 class HuobiState(StatesGroup):
     waiting_for_amount_sell = State()  # Состояние ожидания ввода суммы для SELL
     waiting_for_amount_buy = State()  # Состояние ожидания ввода суммы для BUY
 
 
-def get_huobi_p2p_data(amount: float, trade_type: str = "sell"):
+async def get_huobi_p2p_data(amount: float, trade_type: str = "sell", timeout: aiohttp.ClientTimeout = HUOBI_TIMEOUT,
+                             page: int = 1):
     """
     Получает данные о P2P-предложениях на Huobi.
 
-    :param amount: Сумма для фильтрации предложений.
+    :param amount: Сумма для фильтрации предложений (None - без фильтра).
     :param trade_type: Тип сделки ("sell" или "buy").
-    :return: Словарь с данными о предложениях.
+    :param timeout: Таймаут запроса.
+    :param page: Номер страницы.
+    :return: Тело ответа в байтах (разбирается в decode_huobi_p2p).
     """
-    url = "https://www.htx.com/-/x/otc/v1/data/trade-market"
     params = {
         "coinId": 2,  # USDT
         "currency": 172,  # CNY
         "tradeType": trade_type,  # "sell" или "buy"
-        "currPage": 1,  # Page 1
+        "currPage": page,  # Номер страницы
         "payMethod": 0,  # All payment methods
         "acceptOrder": 0,
         "country": "",
         "blockType": "general",  # General offers
         "online": 1,  # Only online sellers
         "range": 0,
-        "amount": amount,  # Минимальная сумма
+        "amount": amount if amount is not None else "",  # Минимальная сумма
         "isThumbsUp": "false",
         "isMerchant": "false",
         "isTraded": "false",
@@ -50,20 +71,42 @@ def get_huobi_p2p_data(amount: float, trade_type: str = "sell"):
         "User-Agent": HUOBI_USER_AGENT
     }
 
-    response = requests.get(url, params=params, headers=headers)
-    data = response.json()
+    session = get_session()
+    async with track_upstream("htx"):
+        async with session.get(HUOBI_P2P_URL, params=params, headers=headers, timeout=timeout) as response:
+            response.raise_for_status()
+            return await response.read()
 
-    if data["code"] == 200:
-        return data
-    else:
-        raise Exception(f"Huobi API Error: {data['message']}")
+
+def decode_huobi_p2p(raw: bytes, limit: int = 10, mode: str = None):
+    """
+    Декодирует ответ Huobi и оставляет только нужные поля первых limit предложений.
+
+    :param raw: Тело ответа Huobi API.
+    :param limit: Сколько предложений разобрать.
+    :param mode: Режим разбора JSON ("full", "partial" или "auto", см. fastjson).
+    :return: Список предложений: price, quantity (USDT), pay_methods, min_amount, max_amount.
+    """
+    fields, items = load_items(raw, ("data",), limit, mode)
+    if fields.get("code", 200) != 200 or items is None:
+        raise Exception(f"Huobi API Error: {fields.get('message')}")
+    return [
+        {
+            "price": float(offer["price"]),
+            "quantity": float(offer.get("tradeCount") or 0),
+            "pay_methods": [m["name"] for m in offer["payMethods"]],
+            "min_amount": float(offer.get("minTradeLimit") or 0),
+            "max_amount": float(offer.get("maxTradeLimit") or 0),
+        }
+        for offer in items
+    ]
 
 
-def parse_huobi_p2p_data(data):
+def parse_huobi_p2p_data(offers):
     """
     Парсит данные о P2P-предложениях Huobi.
 
-    :param data: Данные, полученные от Huobi API.
+    :param offers: Предложения из decode_huobi_p2p.
     :return: Словарь с минимальной, максимальной и средней ценой, а также количеством предложений с Alipay и WeChat.
     """
     prices = []  # Для хранения всех цен
@@ -71,12 +114,11 @@ def parse_huobi_p2p_data(data):
     wechat_count = 0  # Счетчик WeChat
 
     # Ограничиваемся первыми 10 предложениями
-    for offer in data["data"][:10]:
-        price = float(offer["price"])
-        prices.append(price)
+    for offer in offers[:10]:
+        prices.append(offer["price"])
 
         # Подсчет методов оплаты
-        payment_methods = [m["name"] for m in offer["payMethods"]]
+        payment_methods = offer["pay_methods"]
         if "Alipay" in payment_methods:
             alipay_count += 1
         if "WeChat" in payment_methods:
@@ -98,6 +140,48 @@ def parse_huobi_p2p_data(data):
         return None
 
 
+async def fetch_huobi_p2p(amount: float, trade_type: str = "sell"):
+    """
+    Получает и сразу парсит P2P-данные Huobi.
+    Одновременные одинаковые запросы объединяются в один.
+
+    :return: Результат parse_huobi_p2p_data. Если Huobi недоступен и отдан
+             последний удачный ответ, в словаре есть поле stale_age.
+    """
+    key = p2p_key("huobi", trade_type, amount)
+
+    async def attempt():
+        raw = await get_huobi_p2p_data(amount, trade_type=trade_type)
+        return parse_huobi_p2p_data(decode_huobi_p2p(raw))
+
+    async def request():
+        parsed, stale_age = await upstream("htx").call(key, attempt)
+        if stale_age is not None:
+            return dict(parsed, stale_age=stale_age) if parsed else parsed
+        record_p2p("htx_p2p", trade_type, amount, parsed)
+        on_p2p_quote("htx_p2p", trade_type, parsed)
+        return parsed
+
+    return await p2p_coalescer.run(key, request)
+
+
+async def fetch_huobi_depth(amount: float, trade_type: str = "sell", pages: int = DEPTH_PAGES):
+    """
+    Загружает несколько страниц стакана Huobi параллельно и симулирует
+    исполнение заявки на amount CNY.
+
+    :return: FillResult или None, если предложений нет.
+    """
+    async def fetch_page(page: int):
+        raw = await get_huobi_p2p_data(None, trade_type=trade_type, page=page)
+        return decode_huobi_p2p(raw, limit=HUOBI_PAGE_SIZE)
+
+    async def request():
+        return (await fetch_book(fetch_page, pages)).fill(amount)
+
+    return await p2p_coalescer.run(("depth",) + p2p_key("huobi", trade_type, amount), request)
+
+
 # Обработчик нажатия на кнопку "Huobi"
 @huobi_router.callback_query(F.data == "huobi")
 async def huobi_callback(callback: CallbackQuery):
@@ -166,30 +250,23 @@ async def handle_huobi_sell_amount(message: Message, state: FSMContext):
             )
             return
 
-        # Получаем данные от Huobi API для SELL
-        data = get_huobi_p2p_data(amount, trade_type="sell")
-
-        # Парсим данные
-        parsed_data = parse_huobi_p2p_data(data)
-
-        if parsed_data:
-            result_text = (
-                f"🇨🇳 Huobi P2P Data (SELL):\n\n"
-                f"📉 Min Price: {parsed_data['min_price']} CNY\n"
-                f"📈 Max Price: {parsed_data['max_price']} CNY\n"
-                f"📊 Avg Price: {parsed_data['avg_price']:.2f} CNY\n"
-                f"🔵 Alipay Offers: {parsed_data['alipay_count']}/10\n"
-                f"🟢 WeChat Offers: {parsed_data['wechat_count']}/10"
-            )
+        # Берем снимок ближайшего уровня, если он есть, иначе запрашиваем Huobi API для SELL
+        snapshot = p2p_poller.get("huobi", "sell", amount)
+        if snapshot:
+            parsed_data, age, tier = snapshot
         else:
-            result_text = "🇨🇳 Huobi P2P (SELL):\n\n❌ No offers found for the specified amount."
+            parsed_data = await fetch_huobi_p2p(amount, trade_type="sell")
+
+        result_text, keyboard = render_huobi_p2p("sell", parsed_data)
+        if snapshot:
+            result_text += f"\n\n{format_age(age)} (tier {tier:g} CNY)"
 
         # Редактируем сообщение с меню, добавляя результат
         await message.bot.edit_message_text(
             chat_id=message.chat.id,
             message_id=menu_message_id,
             text=result_text,
-            reply_markup=get_inline_huobi_keyboard()  # Сохраняем клавиатуру
+            reply_markup=keyboard  # Сохраняем клавиатуру
         )
 
     except ValueError:
@@ -236,30 +313,23 @@ async def handle_huobi_buy_amount(message: Message, state: FSMContext):
             )
             return
 
-        # Получаем данные от Huobi API для BUY
-        data = get_huobi_p2p_data(amount, trade_type="buy")
-
-        # Парсим данные
-        parsed_data = parse_huobi_p2p_data(data)
-
-        if parsed_data:
-            result_text = (
-                f"🇨🇳 Huobi P2P Data (BUY):\n\n"
-                f"📉 Min Price: {parsed_data['min_price']} CNY\n"
-                f"📈 Max Price: {parsed_data['max_price']} CNY\n"
-                f"📊 Avg Price: {parsed_data['avg_price']:.2f} CNY\n"
-                f"🔵 Alipay Offers: {parsed_data['alipay_count']}/10\n"
-                f"🟢 WeChat Offers: {parsed_data['wechat_count']}/10"
-            )
+        # Берем снимок ближайшего уровня, если он есть, иначе запрашиваем Huobi API для BUY
+        snapshot = p2p_poller.get("huobi", "buy", amount)
+        if snapshot:
+            parsed_data, age, tier = snapshot
         else:
-            result_text = "🇨🇳 Huobi P2P (BUY):\n\n❌ No offers found for the specified amount."
+            parsed_data = await fetch_huobi_p2p(amount, trade_type="buy")
+
+        result_text, keyboard = render_huobi_p2p("buy", parsed_data)
+        if snapshot:
+            result_text += f"\n\n{format_age(age)} (tier {tier:g} CNY)"
 
         # Редактируем сообщение с меню, добавляя результат
         await message.bot.edit_message_text(
             chat_id=message.chat.id,
             message_id=menu_message_id,
             text=result_text,
-            reply_markup=get_inline_huobi_keyboard()  # Сохраняем клавиатуру
+            reply_markup=keyboard  # Сохраняем клавиатуру
         )
 
     except ValueError:
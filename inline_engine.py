@@ -0,0 +1,216 @@
+import asyncio
+import bisect
+import logging
+import re
+import time
+
+from aiogram.enums import ParseMode
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+
+logger = logging.getLogger(__name__)
+
+# Символы, которые показываются, пока список пар Bybit не загружен
+DEFAULT_SYMBOLS = ["BTCUSDT", "ETHUSDT"]
+
+# Эмодзи для популярных монет (как на кнопках)
+SYMBOL_EMOJI = {"BTC": "🟠", "ETH": "🟣"}
+
+# Запрос P2P: "usdt rub 5000", "usdt cny sell 1000", "usdtrub buy"
+P2P_QUERY = re.compile(r"^usdt\s*/?\s*(rub|cny)(?:\s+(buy|sell))?(?:\s+(\d+(?:[.,]\d+)?))?(?:\s+(buy|sell))?$")
+
+# Настройки P2P-пар: валюта -> (площадка, минимальная сумма, сумма по умолчанию, символ валюты)
+P2P_PAIRS = {
+    "rub": ("bybit", 1000, 5000, "₽"),
+    "cny": ("huobi", 100, 1000, "CNY"),
+}
+
+
+def format_ticker_text(data: dict):
+    """
+    Текст котировки спотовой пары (тот же формат, что и у кнопок).
+    """
+    symbol = data['symbol']
+    emoji = next((e for base, e in SYMBOL_EMOJI.items() if symbol.startswith(base)), "🔹")
+    quote = "USDT" if symbol.endswith("USDT") else ""
+    return (
+        f"{emoji} *{symbol}*\n"
+        f"💰 *Current price:* {data['lastPrice']} {quote}\n"
+        f"📈 *24h High:* {data['highPrice24h']} {quote}\n"
+        f"📉 *24h Low:* {data['lowPrice24h']} {quote}"
+    )
+
+
+class SymbolIndex:
+    """
+    Префиксный индекс символов: отсортированный список и bisect по префиксу.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = sorted(set(s.upper() for s in symbols))
+
+    def search(self, prefix: str):
+        """
+        Возвращает символы, начинающиеся с prefix. Пары к USDT и точные
+        совпадения идут первыми.
+        """
+        lo = bisect.bisect_left(self.symbols, prefix)
+        hi = bisect.bisect_left(self.symbols, prefix + "\uffff")
+        matches = self.symbols[lo:hi]
+        return sorted(matches, key=lambda s: (s != prefix and s != prefix + "USDT", not s.endswith("USDT"), len(s), s))
+
+
+class InlineEngine:
+    """
+    Inline-режим: все спотовые пары Bybit и P2P-пары с подсказками по префиксу,
+    постраничной выдачей и ответами из кешированных котировок.
+    """
+
+    def __init__(self, session, get_ticker, get_p2p, ticker_ttl: float, p2p_ttl: float, page_size: int = 10):
+        """
+        :param session: Сессия pybit (HTTP) для загрузки списка пар.
+        :param get_ticker: Асинхронная функция get_ticker(symbol) -> данные тикера (из кеша).
+        :param get_p2p: Асинхронная функция get_p2p(venue, side, amount) -> (данные, возраст или None).
+        :param ticker_ttl: Время жизни котировок спота (для cache_time).
+        :param p2p_ttl: Время жизни P2P-котировок (для cache_time).
+        :param page_size: Количество результатов на странице.
+        """
+        self.session = session
+        self.get_ticker = get_ticker
+        self.get_p2p = get_p2p
+        self.ticker_ttl = ticker_ttl
+        self.p2p_ttl = p2p_ttl
+        self.page_size = page_size
+        self.index = SymbolIndex(DEFAULT_SYMBOLS)
+        self.loaded = False  # Загружен полный список пар Bybit
+        self.interval = 6 * 3600
+        self.on_demand = False  # Список пар загружается по inline-запросам, а не по расписанию
+        self._next_load = 0.0
+        self._task = None
+
+    def _load_symbols(self):
+        response = self.session.get_instruments_info(category="spot")
+        return [item['symbol'] for item in response['result']['list'] if item.get('status', 'Trading') == 'Trading']
+
+    async def refresh_symbols(self):
+        """
+        Загружает список спотовых пар Bybit и перестраивает индекс.
+        """
+        symbols = await asyncio.to_thread(self._load_symbols)
+        if symbols:
+            self.index = SymbolIndex(symbols)
+            self.loaded = True
+            logger.info(f"Inline index: {len(symbols)} symbols")
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            try:
+                await self.refresh_symbols()
+            except Exception as e:
+                logger.error(f"Error loading Bybit symbols: {e}")
+            await asyncio.sleep(interval)
+
+    def setup(self, dp, interval: float = 6 * 3600, primary: bool = True):
+        """
+        Подключает периодическое обновление списка пар к диспетчеру.
+
+        :param primary: Обновлять список по расписанию в этом процессе (при шардировании -
+                        только в одном воркере). В остальных воркерах список загружается
+                        при inline-запросах, но не чаще одного раза за interval.
+        """
+        self.interval = interval
+        self.on_demand = not primary
+
+        async def start():
+            if primary:
+                self._task = asyncio.create_task(self._refresh_loop(interval))
+
+        async def stop():
+            if self._task is not None:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+
+        dp.startup.register(start)
+        dp.shutdown.register(stop)
+
+    async def _load_on_demand(self):
+        try:
+            await self.refresh_symbols()
+        except Exception as e:
+            logger.error(f"Error loading Bybit symbols: {e}")
+            # После ошибки повторяем не раньше чем через минуту
+            self._next_load = time.monotonic() + min(60.0, self.interval)
+
+    def _schedule_load(self):
+        """
+        Запускает загрузку списка пар в фоне, если пора (ответ на запрос ее не ждет).
+        """
+        if (self._task is not None and not self._task.done()) or time.monotonic() < self._next_load:
+            return
+        self._next_load = time.monotonic() + self.interval
+        self._task = asyncio.create_task(self._load_on_demand())
+
+    async def _spot_results(self, symbols):
+        tickers = await asyncio.gather(*(self.get_ticker(s) for s in symbols), return_exceptions=True)
+        results = []
+        for symbol, data in zip(symbols, tickers):
+            if isinstance(data, Exception):
+                logger.error(f"Inline ticker error ({symbol}): {data}")
+                continue
+            results.append(InlineQueryResultArticle(
+                id=f"spot:{symbol}",
+                title=f"💰 {symbol}",
+                description=f"Цена: {data['lastPrice']}",
+                input_message_content=InputTextMessageContent(
+                    message_text=format_ticker_text(data), parse_mode=ParseMode.MARKDOWN),
+            ))
+        return results
+
+    async def _p2p_results(self, currency: str, side: str, amount: float):
+        venue, minimum, default, sign = P2P_PAIRS[currency]
+        amount = max(minimum, amount or default)
+        sides = [side] if side else ["buy", "sell"]
+        quotes = await asyncio.gather(*(self.get_p2p(venue, s, amount) for s in sides), return_exceptions=True)
+        results = []
+        for s, quote in zip(sides, quotes):
+            if isinstance(quote, Exception) or not quote[0]:
+                continue
+            data, age = quote
+            text = (
+                f"✅ {s.upper()} Rate - USDT/{currency.upper()} ({amount:g} {sign}):\n"
+                f"📈 Max price: {data['max_price']} {sign}\n"
+                f"📉 Min price: {data['min_price']} {sign}\n"
+                f"📊 Average price: {data['avg_price']:.2f} {sign}"
+            )
+            if age is not None:
+                text += f"\n\n⏱ Updated {int(age)}s ago"
+            results.append(InlineQueryResultArticle(
+                id=f"p2p:{currency}:{s}:{amount:g}",
+                title=f"💱 USDT/{currency.upper()} {s.upper()} ({amount:g} {sign})",
+                description=f"Avg: {data['avg_price']:.2f} {sign}",
+                input_message_content=InputTextMessageContent(message_text=text),
+            ))
+        return results
+
+    async def answer(self, query: str, offset: str):
+        """
+        Формирует ответ на inline-запрос.
+
+        :return: Кортеж (результаты, next_offset, cache_time).
+        """
+        if self.on_demand:
+            self._schedule_load()
+        query = query.strip().lower()
+        match = P2P_QUERY.match(query)
+        if match:
+            currency, side1, amount, side2 = match.groups()
+            amount = float(amount.replace(",", ".")) if amount else None
+            results = await self._p2p_results(currency, side1 or side2, amount)
+            return results, "", max(1, int(self.p2p_ttl))
+
+        prefix = re.sub(r"[\s/\-_]", "", query).upper()
+        symbols = self.index.search(prefix) if prefix else DEFAULT_SYMBOLS
+        start = int(offset) if offset.isdigit() else 0
+        page = symbols[start:start + self.page_size]
+        next_offset = str(start + self.page_size) if start + self.page_size < len(symbols) else ""
+        results = await self._spot_results(page)
+        return results, next_offset, max(1, int(self.ticker_ttl))
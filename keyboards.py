@@ -1,6 +1,9 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-def get_main_menu_keyboard():
+# Дополнительные спотовые пары в меню Bybit (цены берутся из общей таблицы тикеров)
+EXTRA_SPOT_SYMBOLS = ["SOLUSDT", "TONUSDT", "XRPUSDT", "DOGEUSDT"]
+
+def _build_main_menu_keyboard():
     """
     Создает инлайн-клавиатуру для основного меню.
     """
@@ -15,15 +18,16 @@ def get_main_menu_keyboard():
             [
                 InlineKeyboardButton(text="🧑‍💻 Support", url="https://t.me/ryotto")
             ],
-            # Третья строка с кнопкой Stars
+            # Третья строка с кнопками Stars и Rates
             [
-                InlineKeyboardButton(text="⭐️ Stars", callback_data="stars")
+                InlineKeyboardButton(text="⭐️ Stars", callback_data="stars"),
+                InlineKeyboardButton(text="📊 Rates", callback_data="rates")
             ]
         ]
     )
     return keyboard
 
-def get_inline_bybit_keyboard():
+def _build_inline_bybit_keyboard():
     """
     Создает инлайн-клавиатуру для меню Bybit.
     """
@@ -34,6 +38,19 @@ def get_inline_bybit_keyboard():
                 InlineKeyboardButton(text="🟠 BTC/USDT", callback_data="btcusdt"),
                 InlineKeyboardButton(text="🟣 ETH/USDT", callback_data="ethusdt")
             ],
+            # Дополнительные спотовые пары по две в строке
+            *[
+                [
+                    InlineKeyboardButton(text=f"🔹 {symbol[:-4]}/USDT", callback_data=f"spot:{symbol}")
+                    for symbol in EXTRA_SPOT_SYMBOLS[i:i + 2]
+                ]
+                for i in range(0, len(EXTRA_SPOT_SYMBOLS), 2)
+            ],
+            # Свечные графики
+            [
+                InlineKeyboardButton(text="📈 BTC chart", callback_data="chart:BTCUSDT:1h"),
+                InlineKeyboardButton(text="📈 ETH chart", callback_data="chart:ETHUSDT:1h")
+            ],
             # Вторая строка с кнопками
             [
                 InlineKeyboardButton(text="🇷🇺 USDT/RUB Buy🟢", callback_data="usdtbuyrub"),
@@ -47,7 +64,7 @@ def get_inline_bybit_keyboard():
     )
     return keyboard
 
-def get_inline_huobi_keyboard():
+def _build_inline_huobi_keyboard():
     """
     Создает инлайн-клавиатуру для меню Huobi.
     """
@@ -64,4 +81,51 @@ def get_inline_huobi_keyboard():
             ]
         ]
     )
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+def _build_back_keyboard(callback_data: str):
+    """
+    Создает клавиатуру с одной кнопкой "Назад".
+    """
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Назад", callback_data=callback_data)]
+    ])
+
+
+# Клавиатуры собираются один раз при импорте и переиспользуются во всех ответах.
+# Объекты общие - не изменяйте их, для другой раскладки соберите новую клавиатуру.
+_MAIN_MENU_KEYBOARD = _build_main_menu_keyboard()
+_INLINE_BYBIT_KEYBOARD = _build_inline_bybit_keyboard()
+_INLINE_HUOBI_KEYBOARD = _build_inline_huobi_keyboard()
+_BACK_KEYBOARDS = {callback: _build_back_keyboard(callback) for callback in ("back", "bybit", "stars")}
+
+
+def get_main_menu_keyboard():
+    """
+    Возвращает клавиатуру основного меню.
+    """
+    return _MAIN_MENU_KEYBOARD
+
+
+def get_inline_bybit_keyboard():
+    """
+    Возвращает клавиатуру меню Bybit.
+    """
+    return _INLINE_BYBIT_KEYBOARD
+
+
+def get_inline_huobi_keyboard():
+    """
+    Возвращает клавиатуру меню Huobi.
+    """
+    return _INLINE_HUOBI_KEYBOARD
+
+
+def get_back_keyboard(callback_data: str = "back"):
+    """
+    Возвращает клавиатуру с кнопкой "Назад" (в главное меню, меню Bybit или Stars).
+    """
+    keyboard = _BACK_KEYBOARDS.get(callback_data)
+    if keyboard is None:
+        keyboard = _BACK_KEYBOARDS[callback_data] = _build_back_keyboard(callback_data)
+    return keyboard
@@ -0,0 +1,481 @@
+"""
+Нагрузочный тест бота.
+
+Запускает настоящие dp и роутеры (router, huobi_router) против локальных
+заглушек Telegram Bot API и бирж (Bybit spot/P2P, HTX, Binance) и отчитывается
+о пропускной способности, задержке от обновления до ответа (p50/p95/p99)
+и задержке event loop.
+
+Пример:
+    python loadtest.py --rate 200 --duration 30 --exchange-latency 0.08 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+
+from aiohttp import web
+
+# Токен нужен только для формата, запросы уходят в заглушку Telegram
+os.environ.setdefault('TOKEN', '123456:LOADTEST')
+# История котировок пишется во временный каталог
+os.environ.setdefault('HISTORY_DIR', os.path.join(tempfile.gettempdir(), 'loadtest_history'))
+
+# Сценарии: одно действие или цепочка шагов одного пользователя
+SCENARIOS = {
+    "spot_btc": [("callback", "btcusdt")],
+    "spot_eth": [("callback", "ethusdt")],
+    "spot_sol": [("callback", "spot:SOLUSDT")],
+    "inline_btc": [("inline", "btc")],
+    "inline_p2p": [("inline", "usdt rub 5000")],
+    "bybit_p2p": [("callback", "usdtbuyrub"), ("message", "5000")],
+    "huobi_p2p": [("callback", "usdtcnysell"), ("message", "1000")],
+    "depth_rub": [("message", "/depth rub buy 500000")],
+    "stars": [("callback", "stars"), ("message", "0.42"), ("message", "1000")],
+    "rates": [("callback", "rates")],
+    "chart_btc": [("callback", "chart:BTCUSDT:1h")],
+}
+
+# Спотовые пары заглушки Bybit (список инструментов и тикеры всего рынка)
+SPOT_SYMBOLS = [f"{base}{quote}" for base in ("BTC", "ETH", "SOL", "TON", "XRP", "DOGE", "ADA", "BNB")
+                for quote in ("USDT", "USDC", "BTC")]
+
+
+def percentile(values, p):
+    """
+    Возвращает перцентиль p (0-100) отсортированного списка.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+class Profile:
+    """
+    Профиль задержек и ошибок для заглушки.
+    """
+
+    def __init__(self, latency: float, jitter: float, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    async def delay(self):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def failed(self):
+        return random.random() < self.error_rate
+
+
+def create_exchange_app(profile: Profile):
+    """
+    Заглушки API бирж с ответами в формате Bybit, HTX и Binance.
+    """
+
+    async def bybit_tickers(request):
+        await profile.delay()
+        if profile.failed():
+            return web.Response(status=500)
+        # Без symbol Bybit возвращает весь спотовый рынок
+        symbols = [request.query["symbol"]] if "symbol" in request.query else SPOT_SYMBOLS
+        items = []
+        for symbol in symbols:
+            price = 65000 + random.random() * 100 if symbol.startswith("BTC") else 3000 + random.random() * 10
+            items.append({
+                "symbol": symbol,
+                "lastPrice": f"{price:.2f}",
+                "highPrice24h": f"{price * 1.02:.2f}",
+                "lowPrice24h": f"{price * 0.98:.2f}",
+            })
+        return web.json_response({
+            "retCode": 0, "retMsg": "OK", "time": int(time.time() * 1000), "retExtInfo": {},
+            "result": {"category": "spot", "list": items},
+        })
+
+    async def bybit_kline(request):
+        await profile.delay()
+        if profile.failed():
+            return web.Response(status=500)
+        # Свечи от новой к старой, первая - текущая (незакрытая)
+        seconds = {"D": 86400}.get(request.query["interval"]) or int(request.query["interval"]) * 60
+        start = int(time.time() // seconds) * seconds
+        price = 65000.0
+        rows = []
+        for index in range(int(request.query.get("limit", 200))):
+            close = price + random.uniform(-100, 100)
+            rows.append([str((start - index * seconds) * 1000), f"{price:.2f}", f"{max(price, close) + 50:.2f}",
+                         f"{min(price, close) - 50:.2f}", f"{close:.2f}", "10", "650000"])
+            price = close
+        return web.json_response({
+            "retCode": 0, "retMsg": "OK", "time": int(time.time() * 1000), "retExtInfo": {},
+            "result": {"category": "spot", "symbol": request.query["symbol"], "list": rows},
+        })
+
+    async def bybit_instruments(request):
+        await profile.delay()
+        return web.json_response({
+            "retCode": 0, "retMsg": "OK", "time": int(time.time() * 1000), "retExtInfo": {},
+            "result": {"category": "spot", "list": [{"symbol": s, "status": "Trading"} for s in SPOT_SYMBOLS]},
+        })
+
+    async def bybit_p2p(request):
+        await profile.delay()
+        if profile.failed():
+            return web.Response(status=500)
+        body = await request.json()
+        page, size = int(body.get("page") or 1), int(body.get("size") or 8)
+        # Чем глубже страница, тем хуже цена
+        items = [{"price": f"{95 + page * 0.5 + random.random() / 2:.2f}", "lastQuantity": "2000",
+                  "minAmount": "1000", "maxAmount": "500000"} for _ in range(size)]
+        return web.json_response({"ret_code": 0, "result": {"count": len(items), "items": items}})
+
+    async def htx_p2p(request):
+        await profile.delay()
+        if profile.failed():
+            return web.Response(status=500)
+        page = int(request.query.get("currPage") or 1)
+        offers = [{
+            "price": f"{7.2 + page * 0.02 + random.random() / 50:.3f}",
+            "tradeCount": "3000",
+            "payMethods": [{"name": random.choice(["Alipay", "WeChat", "Bank"])}],
+            "minTradeLimit": "100", "maxTradeLimit": "50000",
+        } for _ in range(10)]
+        return web.json_response({"code": 200, "message": "success", "data": offers})
+
+    async def binance_price(request):
+        await profile.delay()
+        if profile.failed():
+            return web.Response(status=500)
+        symbol = request.query.get("symbol")
+        price = 5.5 if symbol == "TONUSDT" else 95.0
+        return web.json_response({"symbol": symbol, "price": f"{price + random.random() / 10:.4f}"})
+
+    app = web.Application()
+    app.router.add_get("/v5/market/tickers", bybit_tickers)
+    app.router.add_get("/v5/market/instruments-info", bybit_instruments)
+    app.router.add_get("/v5/market/kline", bybit_kline)
+    app.router.add_post("/fiat/otc/item/online", bybit_p2p)
+    app.router.add_get("/-/x/otc/v1/data/trade-market", htx_p2p)
+    app.router.add_get("/api/v3/ticker/price", binance_price)
+    return app
+
+
+def create_telegram_app(profile: Profile, on_reply):
+    """
+    Заглушка Telegram Bot API: принимает ответы бота и сообщает о них нагрузчику.
+
+    :param on_reply: Функция on_reply(key), где key - id чата или "inline:<id>".
+    """
+    message_ids = itertools.count(1_000_000)
+
+    async def method(request):
+        name = request.match_info["method"]
+        form = await request.post()
+        await profile.delay()
+        if "inline_query_id" in form:
+            on_reply(f"inline:{form['inline_query_id']}")
+            return web.json_response({"ok": True, "result": True})
+        chat_id = int(form["chat_id"]) if "chat_id" in form else None
+        if chat_id is not None:
+            on_reply(chat_id)
+        if name in ("sendMessage", "editMessageText"):
+            return web.json_response({"ok": True, "result": {
+                "message_id": int(form.get("message_id") or next(message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": form.get("text", ""),
+            }})
+        if name == "sendPhoto":
+            return web.json_response({"ok": True, "result": {
+                "message_id": next(message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "photo": [{"file_id": f"photo-{chat_id}", "file_unique_id": "u", "width": 800, "height": 450}],
+            }})
+        return web.json_response({"ok": True, "result": True})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", method)
+    return app
+
+
+class MockServers:
+    """
+    Заглушки в отдельном потоке со своим event loop, чтобы не искажать замеры бота.
+    """
+
+    def __init__(self, exchange_profile: Profile, telegram_profile: Profile, on_reply):
+        self.exchange_profile = exchange_profile
+        self.telegram_profile = telegram_profile
+        self.on_reply = on_reply
+        self.exchange_url = None
+        self.telegram_url = None
+        self._loop = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._serve())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _serve(self):
+        self._runners = []
+        for app, attr in ((create_exchange_app(self.exchange_profile), "exchange_url"),
+                          (create_telegram_app(self.telegram_profile, self.on_reply), "telegram_url")):
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            setattr(self, attr, f"http://127.0.0.1:{port}")
+            self._runners.append(runner)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        async def cleanup():
+            for runner in self._runners:
+                await runner.cleanup()
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class LoadTest:
+    """
+    Генератор обновлений с открытой нагрузкой: rate действий в секунду
+    от случайных свободных пользователей.
+    """
+
+    def __init__(self, app, rate: float, duration: float, users: int, timeout: float, scenarios):
+        self.app = app
+        self.rate = rate
+        self.duration = duration
+        self.users = users
+        self.timeout = timeout
+        self.scenarios = scenarios
+        self.loop = None
+        self._pending = {}  # ключ ответа -> (future, время отправки)
+        self._update_ids = itertools.count(1)
+        self._ids = itertools.count(1)
+        self.latencies = []
+        self.loop_lags = []
+        self.timeouts = 0
+        self.dropped = 0
+        self.errors = 0
+        self.skipped_edits = 0
+        self._user_messages = {}  # chat_id -> message_id меню
+
+    def on_reply(self, key):
+        """
+        Вызывается из потока заглушки Telegram при каждом ответе бота.
+        """
+        received = time.perf_counter()
+        self.loop.call_soon_threadsafe(self._resolve, key, received)
+
+    async def skipped_edit_middleware(self, make_request, bot, method):
+        """
+        Мидлварь сессии: правка, пропущенная планировщиком (текст не изменился),
+        тоже считается ответом - пользователь уже видит актуальное сообщение.
+        """
+        result = await make_request(bot, method)
+        if result is True and type(method).__name__ == "EditMessageText":
+            self.skipped_edits += 1
+            self.on_reply(method.chat_id)
+        return result
+
+    def _resolve(self, key, received):
+        entry = self._pending.pop(key, None)
+        if entry and not entry[0].done():
+            entry[0].set_result(received)
+
+    def _build_update(self, chat_id: int, kind: str, payload: str):
+        user = {"id": chat_id, "is_bot": False, "first_name": "Load"}
+        chat = {"id": chat_id, "type": "private"}
+        update = {"update_id": next(self._update_ids)}
+        now = int(time.time())
+        if kind == "callback":
+            message_id = self._user_messages.setdefault(chat_id, next(self._ids))
+            update["callback_query"] = {
+                "id": str(next(self._ids)), "from": user, "chat_instance": str(chat_id), "data": payload,
+                "message": {"message_id": message_id, "date": now, "chat": chat, "text": "menu",
+                            "from": {"id": 1, "is_bot": True, "first_name": "Bot"}},
+            }
+            key = chat_id
+        elif kind == "inline":
+            inline_id = str(next(self._ids))
+            update["inline_query"] = {"id": inline_id, "from": user, "query": payload, "offset": ""}
+            key = f"inline:{inline_id}"
+        else:
+            update["message"] = {"message_id": next(self._ids), "date": now, "chat": chat, "from": user, "text": payload}
+            key = chat_id
+        return update, key
+
+    async def _step(self, chat_id: int, kind: str, payload: str):
+        from aiogram.types import Update
+
+        raw, key = self._build_update(chat_id, kind, payload)
+        update = Update.model_validate(raw, context={"bot": self.app.bot})
+        future = self.loop.create_future()
+        started = time.perf_counter()
+        self._pending[key] = (future, started)
+        try:
+            await self.app.dp.feed_update(self.app.bot, update)
+        except Exception:
+            self.errors += 1
+        try:
+            received = await asyncio.wait_for(future, self.timeout)
+            self.latencies.append(received - started)
+            return True
+        except asyncio.TimeoutError:
+            self._pending.pop(key, None)
+            self.timeouts += 1
+            return False
+
+    async def _session(self, chat_id: int, idle: deque):
+        try:
+            steps = SCENARIOS[random.choice(self.scenarios)]
+            for kind, payload in steps:
+                if not await self._step(chat_id, kind, payload):
+                    break
+        finally:
+            idle.append(chat_id)
+
+    async def _monitor_loop_lag(self, interval: float = 0.01):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lags.append(time.perf_counter() - started - interval)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        users = list(range(10_000_000, 10_000_000 + self.users))
+        random.shuffle(users)
+        # Очередь FIFO: освободившийся пользователь возвращается в конец и не
+        # получает новую сессию сразу (иначе срабатывает лимит отправки в чат)
+        idle = deque(users)
+        monitor = asyncio.create_task(self._monitor_loop_lag())
+        tasks = set()
+        started = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - started < self.duration:
+            # Сколько сессий должно было стартовать к этому моменту
+            due = int((time.perf_counter() - started) * self.rate)
+            while sent < due:
+                sent += 1
+                if not idle:
+                    self.dropped += 1
+                    continue
+                task = asyncio.create_task(self._session(idle.popleft(), idle))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        monitor.cancel()
+        return elapsed
+
+    def report(self, elapsed: float):
+        latencies = sorted(self.latencies)
+        lags = sorted(self.loop_lags)
+        print(f"Duration:        {elapsed:.1f} s")
+        print(f"Replies:         {len(latencies)} ({len(latencies) / elapsed:.1f}/s)")
+        print(f"Timeouts:        {self.timeouts}")
+        print(f"Handler errors:  {self.errors}")
+        print(f"Dropped (no idle users): {self.dropped}")
+        print(f"Skipped edits:   {self.skipped_edits}")
+        print("Update-to-reply latency (ms): "
+              f"p50={percentile(latencies, 50) * 1000:.1f} "
+              f"p95={percentile(latencies, 95) * 1000:.1f} "
+              f"p99={percentile(latencies, 99) * 1000:.1f} "
+              f"max={(latencies[-1] if latencies else 0) * 1000:.1f}")
+        print("Event loop lag (ms): "
+              f"p50={percentile(lags, 50) * 1000:.1f} "
+              f"p99={percentile(lags, 99) * 1000:.1f} "
+              f"max={(lags[-1] if lags else 0) * 1000:.1f}")
+
+
+def configure_app(app, exchange_url: str, telegram_url: str, request_middlewares=()):
+    """
+    Направляет бота и все клиенты бирж на локальные заглушки.
+
+    :param request_middlewares: Мидлвари сессии нагрузчика (выполняются до планировщика отправки).
+    """
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    import bybit_p2p
+    import huobi
+    import stars
+
+    app.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(telegram_url))
+    for middleware in request_middlewares:
+        app.bot.session.middleware(middleware)
+    app.bot.session.middleware(app.send_scheduler)
+    app.session.endpoint = exchange_url
+    bybit_p2p.BYBIT_P2P_URL = f"{exchange_url}/fiat/otc/item/online"
+    huobi.HUOBI_P2P_URL = f"{exchange_url}/-/x/otc/v1/data/trade-market"
+    stars.BINANCE_PRICE_URL = f"{exchange_url}/api/v3/ticker/price"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальных заглушках")
+    parser.add_argument("--rate", type=float, default=50, help="Сессий пользователей в секунду")
+    parser.add_argument("--duration", type=float, default=20, help="Длительность теста в секундах")
+    parser.add_argument("--users", type=int, default=5000, help="Количество виртуальных пользователей")
+    parser.add_argument("--timeout", type=float, default=15, help="Сколько ждать ответа на обновление")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Сценарии через запятую")
+    parser.add_argument("--exchange-latency", type=float, default=0.05, help="Средняя задержка бирж (с)")
+    parser.add_argument("--exchange-jitter", type=float, default=0.02, help="Разброс задержки бирж (с)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ошибок бирж (0-1)")
+    parser.add_argument("--tg-latency", type=float, default=0.02, help="Средняя задержка Telegram (с)")
+    parser.add_argument("--tg-jitter", type=float, default=0.005, help="Разброс задержки Telegram (с)")
+    parser.add_argument("--send-rate", type=float, default=None,
+                        help="Общий лимит отправки сообщений в секунду (по умолчанию как у бота)")
+    parser.add_argument("--with-background", action="store_true",
+                        help="Запустить фоновые задачи бота (опрос P2P и т.д.)")
+    args = parser.parse_args()
+
+    import bot as app
+
+    app.setup_dispatcher()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    test = LoadTest(app, args.rate, args.duration, args.users, args.timeout, scenarios)
+
+    servers = MockServers(
+        Profile(args.exchange_latency, args.exchange_jitter, args.error_rate),
+        Profile(args.tg_latency, args.tg_jitter, 0.0),
+        test.on_reply,
+    )
+    servers.start()
+    configure_app(app, servers.exchange_url, servers.telegram_url, [test.skipped_edit_middleware])
+    if args.send_rate:
+        from outbound import TokenBucket
+        app.send_scheduler.global_bucket = TokenBucket(args.send_rate, args.send_rate)
+
+    if args.with_background:
+        await app.dp.emit_startup(bot=app.bot, dispatcher=app.dp)
+    try:
+        elapsed = await test.run()
+    finally:
+        if args.with_background:
+            await app.dp.emit_shutdown(bot=app.bot, dispatcher=app.dp)
+        else:
+            from http_session import close_session
+            await close_session()
+        await app.bot.session.close()
+        servers.stop()
+    test.report(elapsed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,253 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, InlineQuery, Message, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки (в секундах)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """
+    Счетчик с метками в стиле Prometheus.
+    """
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}  # значения меток -> число
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма с метками в стиле Prometheus.
+    """
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # значения меток -> [счетчики корзин..., сумма, количество]
+
+    def observe(self, value: float, *label_values):
+        entry = self._values.get(label_values)
+        if entry is None:
+            entry = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[i] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, entry in sorted(self._values.items()):
+            for i, bound in enumerate(self.buckets):
+                labels = _format_labels(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {entry[i]}")
+            labels = _format_labels(self.labels + ("le",), label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {entry[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик, которые отдаются на /metrics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list]):
+        """
+        Добавляет функцию, которая возвращает строки метрик при каждом запросе /metrics.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_latency = registry.register(Histogram(
+    "bot_handler_latency_seconds", "Время обработки обновления хендлером", labels=("handler", "key")))
+handler_errors = registry.register(Counter(
+    "bot_handler_errors_total", "Необработанные исключения в хендлерах", labels=("handler", "key")))
+upstream_latency = registry.register(Histogram(
+    "bot_upstream_latency_seconds", "Время запроса к бирже", labels=("venue",)))
+upstream_errors = registry.register(Counter(
+    "bot_upstream_errors_total", "Ошибки запросов к бирже", labels=("venue",)))
+cache_requests = registry.register(Counter(
+    "bot_cache_requests_total", "Обращения к кешам котировок", labels=("cache", "result")))
+
+
+@asynccontextmanager
+async def track_upstream(venue: str):
+    """
+    Замеряет время и ошибки запроса к бирже.
+
+    Пример: async with track_upstream("htx"): ...
+
+    :param venue: Площадка ("bybit_spot", "bybit_p2p", "htx", "binance").
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        upstream_errors.inc(venue)
+        raise
+    finally:
+        upstream_latency.observe(time.perf_counter() - started, venue)
+
+
+def record_cache(cache: str, hit: bool):
+    """
+    Учитывает попадание или промах кеша.
+    """
+    cache_requests.inc(cache, "hit" if hit else "miss")
+
+
+def _event_key(event: TelegramObject, data: Dict[str, Any], commands=frozenset(), callbacks=frozenset()):
+    """
+    Ключ для метрик хендлера: callback_data, состояние FSM или тип события.
+
+    Команды и callback_data приходят от пользователя, поэтому в ключ попадают
+    только известные команды и префиксы callback_data (до ":"), остальные
+    считаются как "other" - иначе число рядов метрик растет без ограничений.
+
+    :param commands: Известные команды без "/" (например, "start").
+    :param callbacks: Известные callback_data и их префиксы (например, "spot").
+    """
+    if isinstance(event, CallbackQuery):
+        prefix = (event.data or "").split(":", 1)[0]
+        return f"callback:{prefix if prefix in callbacks else 'other'}"
+    raw_state = data.get("raw_state")
+    if raw_state:
+        return f"state:{raw_state}"
+    if isinstance(event, InlineQuery):
+        return "inline"
+    if isinstance(event, Message) and event.text and event.text.startswith("/"):
+        command = event.text.split()[0][1:].split("@", 1)[0].lower()
+        return f"command:/{command if command in commands else 'other'}"
+    return "message"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Мидлварь, которая замеряет время работы каждого хендлера.
+    """
+
+    def __init__(self, commands=(), callbacks=()):
+        self.commands = frozenset(commands)
+        self.callbacks = frozenset(callbacks)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        key = _event_key(event, data, self.commands, self.callbacks)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name, key)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name, key)
+
+
+async def _metrics_view(request: web.Request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+class MetricsServer:
+    """
+    Локальный HTTP-сервер с эндпоинтом /metrics.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", _metrics_view)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host=self.host, port=self.port).start()
+        logger.info(f"Metrics server started on {self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def setup_metrics(dp, host: str = "127.0.0.1", port: int = None, commands=(), callbacks=()):
+    """
+    Подключает мидлварь метрик к диспетчеру и, если задан порт, сервер /metrics.
+
+    :param dp: Диспетчер aiogram.
+    :param host: Адрес сервера метрик.
+    :param port: Порт сервера метрик (None - сервер не запускается).
+    :param commands: Команды, которые учитываются в метриках по отдельности.
+    :param callbacks: callback_data и префиксы, которые учитываются по отдельности.
+    """
+    middleware = MetricsMiddleware(commands, callbacks)
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    dp.inline_query.middleware(middleware)
+
+    if port:
+        server = MetricsServer(host, port)
+        dp.startup.register(server.start)
+        dp.shutdown.register(server.stop)
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup, EditMessageText,
+    ForwardMessage, SendDocument, SendMessage, SendPhoto,
+)
+
+from metrics import registry, Counter
+
+logger = logging.getLogger(__name__)
+
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений
+THROTTLED_METHODS = (
+    SendMessage, SendPhoto, SendDocument, CopyMessage, ForwardMessage,
+    EditMessageText, EditMessageReplyMarkup, EditMessageCaption, EditMessageMedia,
+)
+
+outbound_requests = registry.register(Counter(
+    "bot_outbound_requests_total", "Исходящие запросы к Telegram", labels=("method", "result")))
+
+
+class TokenBucket:
+    """
+    Token bucket с резервированием: каждый вызов сразу занимает токен
+    (баланс может уйти в минус) и получает время ожидания. Так очередь
+    ожидающих обслуживается по порядку без блокировок.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self):
+        """
+        Занимает токен и возвращает, сколько секунд нужно подождать перед отправкой.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        """
+        Приостанавливает отправку (после ответа 429 с retry_after).
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов бота (мидлварь сессии aiogram).
+
+    Отправка сообщений проходит через общий и поканальный token bucket,
+    ответы 429 повторяются после retry_after. Правки, текст и клавиатура
+    которых совпадают с тем, что уже показано в сообщении, не отправляются:
+    для каждого (chat_id, message_id) хранится хеш последнего содержимого.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, max_retries: int = 3, max_chats: int = 10000,
+                 max_messages: int = 50000):
+        """
+        :param global_rate: Сообщений в секунду на всего бота.
+        :param chat_rate: Сообщений в секунду в личный чат.
+        :param chat_burst: Сколько сообщений подряд можно отправить в чат без ожидания.
+        :param group_rate: Сообщений в секунду в группу или канал.
+        :param max_retries: Сколько раз повторять запрос после 429.
+        :param max_chats: Сколько поканальных bucket'ов хранить.
+        :param max_messages: Сколько хешей содержимого сообщений хранить.
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.max_messages = max_messages
+        self._chats = OrderedDict()  # chat_id -> TokenBucket
+        self._shown = OrderedDict()  # (chat_id, message_id) -> хеш содержимого
+        self._markups = {}  # id(клавиатуры) -> (клавиатура, JSON) для общих клавиатур из keyboards.py
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1 if is_group else self.chat_burst)
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _remember(self, key, content_hash):
+        self._shown[key] = content_hash
+        self._shown.move_to_end(key)
+        if len(self._shown) > self.max_messages:
+            self._shown.popitem(last=False)
+
+    @staticmethod
+    def _message_key(method):
+        if getattr(method, "inline_message_id", None):
+            return ("inline", method.inline_message_id)
+        message_id = getattr(method, "message_id", None)
+        if message_id is None:
+            return None
+        return (method.chat_id, message_id)
+
+    def _markup_json(self, markup):
+        """
+        JSON клавиатуры. Общие клавиатуры сериализуются один раз: объект хранится
+        вместе с JSON, поэтому его id не может достаться другой клавиатуре.
+        """
+        if markup is None:
+            return None
+        entry = self._markups.get(id(markup))
+        if entry is not None and entry[0] is markup:
+            return entry[1]
+        dumped = markup.model_dump_json(exclude_none=True)
+        if len(self._markups) < 256:
+            self._markups[id(markup)] = (markup, dumped)
+        return dumped
+
+    def _content_hash(self, method):
+        return hash((method.text, str(method.parse_mode), self._markup_json(method.reply_markup)))
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, THROTTLED_METHODS):
+            return await make_request(bot, method)
+
+        name = type(method).__name__
+        key = self._message_key(method) if not isinstance(method, SendMessage) else None
+        content_hash = None
+        if isinstance(method, EditMessageText):
+            content_hash = self._content_hash(method)
+            if key is not None and self._shown.get(key) == content_hash:
+                outbound_requests.inc(name, "skipped")
+                return True
+        elif key is not None:
+            # Другие правки меняют сообщение частично - хеш больше не актуален
+            self._shown.pop(key, None)
+
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+        for attempt in range(self.max_retries + 1):
+            wait = self.global_bucket.reserve()
+            if chat_bucket is not None:
+                wait = max(wait, chat_bucket.reserve())
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    outbound_requests.inc(name, "error")
+                    raise
+                outbound_requests.inc(name, "retry")
+                logger.warning(f"Flood limit on {name} (chat {chat_id}), retry after {e.retry_after}s")
+                (chat_bucket or self.global_bucket).pause(e.retry_after)
+                continue
+            except TelegramBadRequest as e:
+                if "message is not modified" in e.message and key is not None:
+                    outbound_requests.inc(name, "skipped")
+                    if content_hash is not None:
+                        self._remember(key, content_hash)
+                    return True
+                outbound_requests.inc(name, "error")
+                raise
+            break
+
+        outbound_requests.inc(name, "sent")
+        if isinstance(method, SendMessage):
+            self._remember((result.chat.id, result.message_id), self._content_hash(method))
+        elif key is not None and content_hash is not None:
+            self._remember(key, content_hash)
+        return result
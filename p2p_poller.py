@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import time
+
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class P2PPoller:
+    """
+    Фоновый опрос P2P-площадок по заранее заданным уровням сумм (tiers).
+
+    Для каждой пары (площадка, сторона) периодически запрашиваются снимки
+    для всех уровней. Обработчики отвечают из снимка ближайшего уровня
+    и показывают его возраст, не обращаясь к бирже. Площадки фильтруют
+    предложения по сумме, поэтому снимок используется, только если уровень
+    отличается от суммы не больше чем в max_ratio раз.
+    """
+
+    def __init__(self, max_ratio: float = 2.0):
+        """
+        :param max_ratio: Во сколько раз уровень может отличаться от суммы запроса.
+        """
+        self.max_ratio = max_ratio
+        self._venues = {}  # venue -> {"interval": float, "sides": {side: (fetch, tiers)}}
+        self._snapshots = {}  # (venue, side, tier) -> (время получения, данные)
+        self._tasks = []
+
+    def register(self, venue: str, side: str, fetch, tiers, interval: float):
+        """
+        Регистрирует площадку и сторону для фонового опроса.
+
+        :param venue: Название площадки ("bybit", "huobi").
+        :param side: Сторона сделки ("buy" или "sell").
+        :param fetch: Асинхронная функция fetch(amount, side) -> распарсенные данные или None.
+        :param tiers: Список сумм для опроса.
+        :param interval: Интервал обновления площадки в секундах.
+        """
+        tiers = sorted({float(t) for t in tiers})
+        if not tiers:
+            return
+        venue_config = self._venues.setdefault(venue, {"interval": interval, "sides": {}})
+        venue_config["interval"] = interval
+        venue_config["sides"][side] = (fetch, tiers)
+
+    def nearest_tier(self, venue: str, side: str, amount: float):
+        """
+        Возвращает уровень, ближайший к сумме (по отношению сумм), или None,
+        если ближайший уровень отличается от суммы больше чем в max_ratio раз.
+        """
+        venue_config = self._venues.get(venue)
+        if not venue_config or side not in venue_config["sides"] or amount <= 0:
+            return None
+        tiers = venue_config["sides"][side][1]
+        tier = min(tiers, key=lambda t: max(t, amount) / min(t, amount))
+        if max(tier, amount) / min(tier, amount) > self.max_ratio:
+            return None
+        return tier
+
+    def get(self, venue: str, side: str, amount: float):
+        """
+        Возвращает снимок ближайшего уровня.
+
+        :return: Кортеж (данные, возраст в секундах, уровень) или None, если подходящего
+                 уровня или снимка нет, или он старше трех интервалов обновления.
+        """
+        tier = self.nearest_tier(venue, side, amount)
+        if tier is None:
+            record_cache(f"p2p_{venue}", False)
+            return None
+        entry = self._snapshots.get((venue, side, tier))
+        if entry is None or time.monotonic() - entry[0] > self._venues[venue]["interval"] * 3:
+            record_cache(f"p2p_{venue}", False)
+            return None
+        record_cache(f"p2p_{venue}", True)
+        return entry[1], time.monotonic() - entry[0], tier
+
+    def dump_state(self):
+        """
+        Снимки для сохранения на диск: список ("площадка:сторона:уровень", возраст, данные).
+        """
+        now = time.monotonic()
+        return [(f"{venue}:{side}:{tier!r}", now - fetched, data)
+                for (venue, side, tier), (fetched, data) in self._snapshots.items()]
+
+    def restore_state(self, entries):
+        """
+        Восстанавливает снимки зарегистрированных уровней, которые еще не устарели.
+        """
+        now = time.monotonic()
+        for key, age, data in entries:
+            venue, side, tier = key.split(":")
+            venue_config = self._venues.get(venue)
+            if not venue_config or side not in venue_config["sides"] or age > venue_config["interval"] * 3:
+                continue
+            tier = float(tier)
+            if tier in venue_config["sides"][side][1]:
+                self._snapshots[(venue, side, tier)] = (now - age, data)
+
+    def _initial_delay(self, venue: str):
+        """
+        Сколько ждать первого обновления площадки: если снимки всех уровней
+        восстановлены и моложе интервала, то до их устаревания, иначе 0.
+        """
+        venue_config = self._venues[venue]
+        oldest = 0.0
+        for side, (_, tiers) in venue_config["sides"].items():
+            for tier in tiers:
+                entry = self._snapshots.get((venue, side, tier))
+                if entry is None:
+                    return 0.0
+                oldest = max(oldest, time.monotonic() - entry[0])
+        return max(0.0, venue_config["interval"] - oldest)
+
+    def _store(self, key, data):
+        """
+        Сохраняет снимок. Сохраненные данные площадки (stale_age) получают
+        время их настоящего получения и не заменяют более свежий снимок.
+        """
+        stale_age = data.get('stale_age') if data else None
+        if stale_age is None:
+            self._snapshots[key] = (time.monotonic(), data)
+            return
+        fetched = time.monotonic() - stale_age
+        current = self._snapshots.get(key)
+        if current is None or current[0] < fetched:
+            # Возраст снимка теперь настоящий, пометка из ответа не нужна
+            self._snapshots[key] = (fetched, {k: v for k, v in data.items() if k != 'stale_age'})
+
+    async def refresh_venue(self, venue: str):
+        """
+        Обновляет снимки всех уровней площадки (последовательно, чтобы не превышать лимиты).
+        """
+        for side, (fetch, tiers) in self._venues[venue]["sides"].items():
+            for tier in tiers:
+                try:
+                    data = await fetch(tier, side)
+                    self._store((venue, side, tier), data)
+                except Exception as e:
+                    logger.error(f"P2P poller error ({venue} {side} {tier}): {e}")
+
+    async def _run_venue(self, venue: str):
+        await asyncio.sleep(self._initial_delay(venue))
+        while True:
+            started = time.monotonic()
+            await self.refresh_venue(venue)
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, self._venues[venue]["interval"] - elapsed))
+
+    async def start(self):
+        """
+        Запускает фоновый опрос (вызывается при запуске диспетчера).
+        """
+        if self._tasks:
+            return
+        for venue in self._venues:
+            self._tasks.append(asyncio.create_task(self._run_venue(venue)))
+
+    async def stop(self):
+        """
+        Останавливает фоновый опрос (вызывается при остановке диспетчера).
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def parse_tiers(value: str):
+    """
+    Парсит список уровней из строки вида "1000,5000,10000".
+    """
+    return [float(v) for v in value.split(',') if v.strip()]
+
+
+def format_age(age: float):
+    """
+    Форматирует возраст снимка для пользователя.
+    """
+    return f"⏱ Updated {int(age)}s ago"
+
+
+# Общий экземпляр для всех роутеров (допустимое отличие суммы от уровня - P2P_TIER_MAX_RATIO в .env)
+p2p_poller = P2PPoller(max_ratio=float(os.getenv('P2P_TIER_MAX_RATIO', '2')))
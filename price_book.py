@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiohttp
+
+from http_session import get_session
+
+logger = logging.getLogger(__name__)
+
+# Публичный WebSocket Bybit для спотового рынка
+BYBIT_SPOT_WS_URL = "wss://stream.bybit.com/v5/public/spot"
+
+
+class PriceBook:
+    """
+    Книга цен в памяти, которую наполняет поток тикеров Bybit по WebSocket.
+
+    Хранит последнюю цену, 24h High и 24h Low по каждому символу. Чтение из
+    книги не делает сетевых запросов. Если поток молчит дольше stale_after
+    секунд, то данные считаются устаревшими и get() возвращает None, чтобы
+    вызывающий код мог обратиться к REST.
+    """
+
+    def __init__(self, symbols, url: str = BYBIT_SPOT_WS_URL, stale_after: float = 10.0,
+                 ping_interval: float = 20.0, reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0,
+                 on_update=None):
+        """
+        :param symbols: Список символов для подписки (например, ["BTCUSDT", "ETHUSDT"]).
+        :param url: Адрес WebSocket (можно указать локальный сервер для тестов).
+        :param stale_after: Через сколько секунд без обновлений данные считаются устаревшими.
+        :param ping_interval: Интервал отправки ping в секундах.
+        :param reconnect_delay: Начальная задержка перед переподключением.
+        :param max_reconnect_delay: Максимальная задержка перед переподключением.
+        :param on_update: Функция on_update(ticker), вызываемая после каждого обновления.
+        """
+        self.symbols = [s.upper() for s in symbols]
+        self.url = url
+        self.stale_after = stale_after
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.on_update = on_update
+        self._book = {}  # symbol -> (время обновления, данные тикера)
+        self._task = None
+        self.connected = False
+        self.reconnects = 0
+
+    def update(self, data: dict):
+        """
+        Обновляет запись книги из сообщения потока тикеров.
+        """
+        symbol = data.get('symbol')
+        if not symbol:
+            return
+        entry = self._book.get(symbol)
+        ticker = dict(entry[1]) if entry else {}
+        # Спотовый поток присылает полные снимки, но на всякий случай объединяем поля
+        ticker.update(data)
+        self._book[symbol] = (time.monotonic(), ticker)
+        if self.on_update is not None:
+            self.on_update(ticker)
+
+    def age(self, symbol: str):
+        """
+        Возвращает возраст данных по символу в секундах или None, если данных нет.
+        """
+        entry = self._book.get(symbol.upper())
+        if entry is None:
+            return None
+        return time.monotonic() - entry[0]
+
+    def get(self, symbol: str):
+        """
+        Возвращает свежие данные тикера из книги или None, если они устарели.
+
+        :param symbol: Символ спотовой пары.
+        :return: Словарь с полями symbol, lastPrice, highPrice24h, lowPrice24h.
+        """
+        entry = self._book.get(symbol.upper())
+        if entry is None or time.monotonic() - entry[0] > self.stale_after:
+            return None
+        return entry[1]
+
+    def _handle_message(self, raw: str):
+        """
+        Разбирает сообщение WebSocket и обновляет книгу.
+        """
+        message = json.loads(raw)
+        topic = message.get('topic', '')
+        if topic.startswith('tickers.'):
+            data = message.get('data')
+            if isinstance(data, list):
+                for item in data:
+                    self.update(item)
+            elif isinstance(data, dict):
+                self.update(data)
+        elif message.get('op') == 'subscribe' and not message.get('success', True):
+            logger.error(f"Bybit WS subscribe failed: {message.get('ret_msg')}")
+
+    async def _ping(self, ws):
+        """
+        Периодически отправляет ping, чтобы Bybit не закрыл соединение.
+        """
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await ws.send_json({"op": "ping"})
+
+    async def _run_once(self):
+        """
+        Одно подключение: подписка на символы и чтение сообщений до разрыва.
+        """
+        session = get_session()
+        async with session.ws_connect(self.url) as ws:
+            # При каждом подключении подписываемся заново
+            await ws.send_json({"op": "subscribe", "args": [f"tickers.{s}" for s in self.symbols]})
+            self.connected = True
+            ping_task = asyncio.create_task(self._ping(ws))
+            try:
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        self._handle_message(msg.data)
+                    elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        break
+            finally:
+                self.connected = False
+                ping_task.cancel()
+
+    async def run(self):
+        """
+        Основной цикл: подключение с переподключением при ошибках.
+        """
+        delay = self.reconnect_delay
+        while True:
+            started = time.monotonic()
+            try:
+                await self._run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Bybit WS error: {e}")
+            # Если соединение прожило долго, начинаем задержку заново
+            if time.monotonic() - started > self.max_reconnect_delay:
+                delay = self.reconnect_delay
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def start(self):
+        """
+        Запускает поток в фоне (вызывается при запуске диспетчера).
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Останавливает поток (вызывается при остановке диспетчера).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteStore:
+    """
+    Снимок кешей котировок на диске для быстрого старта.
+
+    Кеши (таблица спотового рынка, P2P-снимки, пары Binance) периодически
+    сохраняются в SQLite с временем получения каждой записи. При запуске
+    записи загружаются обратно со своим настоящим возрастом, поэтому
+    данные, которые еще не старше TTL своего кеша, отдаются сразу, а
+    первая волна пользователей после перезапуска не уходит на биржи.
+    """
+
+    def __init__(self, path: str = "quotes.sqlite3", interval: float = 30.0, max_age: float = 900.0):
+        """
+        :param path: Путь к файлу базы данных.
+        :param interval: Интервал сохранения в секундах.
+        :param max_age: Записи старше этого возраста при загрузке пропускаются.
+        """
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self._sources = {}  # name -> (dump, restore)
+        self._conn = None
+        self._task = None
+
+    def register(self, name: str, dump, restore):
+        """
+        Регистрирует кеш.
+
+        :param name: Название кеша (ключ в базе).
+        :param dump: Функция dump() -> список (ключ, возраст в секундах, данные JSON).
+        :param restore: Функция restore(записи) с тем же форматом записей.
+        """
+        self._sources[name] = (dump, restore)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quotes ("
+                "source TEXT, key TEXT, fetched REAL, data TEXT, PRIMARY KEY (source, key))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def load(self):
+        """
+        Загружает сохраненные записи в зарегистрированные кеши.
+
+        :return: Количество загруженных записей.
+        """
+        now = time.time()
+        entries = {}
+        try:
+            rows = self._connect().execute(
+                "SELECT source, key, fetched, data FROM quotes WHERE fetched >= ?", (now - self.max_age,))
+            for source, key, fetched, data in rows:
+                entries.setdefault(source, []).append((key, max(0.0, now - fetched), json.loads(data)))
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error loading quote cache {self.path}: {e}")
+            return 0
+
+        loaded = 0
+        for name, (_, restore) in self._sources.items():
+            if name in entries:
+                try:
+                    restore(entries[name])
+                    loaded += len(entries[name])
+                except Exception as e:
+                    logger.error(f"Error restoring {name} from quote cache: {e}")
+        logger.info(f"Quote cache: loaded {loaded} entries from {self.path}")
+        return loaded
+
+    def _dump(self):
+        now = time.time()
+        rows = []
+        for name, (dump, _) in self._sources.items():
+            for key, age, data in dump():
+                rows.append((name, key, now - age, json.dumps(data, separators=(",", ":"))))
+        return rows
+
+    def _write(self, rows):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM quotes")
+            conn.executemany("INSERT OR REPLACE INTO quotes (source, key, fetched, data) VALUES (?, ?, ?, ?)", rows)
+
+    async def save(self):
+        """
+        Сохраняет текущее состояние кешей (запись в базу - в отдельном потоке).
+        """
+        rows = self._dump()
+        await asyncio.to_thread(self._write, rows)
+        return len(rows)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"Error saving quote cache: {e}")
+
+    async def start(self):
+        """
+        Запускает периодическое сохранение (вызывается при запуске диспетчера).
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает сохранение и сохраняет состояние последний раз.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.save()
+        except Exception as e:
+            logger.error(f"Error saving quote cache: {e}")
+        self.close()
+
+    def close(self):
+        """
+        Закрывает соединение с базой (процессы, которые снимок только загружают).
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# Общий снимок кешей (путь и интервал настраиваются через QUOTE_CACHE_* в .env)
+quote_store = QuoteStore(
+    path=os.getenv('QUOTE_CACHE_PATH', 'quotes.sqlite3'),
+    interval=float(os.getenv('QUOTE_CACHE_INTERVAL', '30')),
+    max_age=float(os.getenv('QUOTE_CACHE_MAX_AGE', '900')),
+)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+import warnings
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Валюты матрицы: все котировки приводятся к "единиц валюты за 1 USDT"
+CURRENCIES = ["USDT", "RUB", "CNY", "TON", "BTC", "ETH"]
+
+
+class RateSource:
+    """
+    Один источник котировки для матрицы.
+    """
+
+    __slots__ = ("currency", "venue", "fetch", "inverted")
+
+    def __init__(self, currency: str, venue: str, fetch, inverted: bool = False):
+        """
+        :param currency: Валюта из CURRENCIES.
+        :param venue: Подпись площадки ("Bybit P2P buy", "Binance" и т.п.).
+        :param fetch: Асинхронная функция без аргументов -> цена.
+        :param inverted: True, если fetch возвращает цену 1 единицы в USDT (BTC, TON),
+                         False - если количество единиц за 1 USDT (RUB, CNY).
+        """
+        self.currency = currency
+        self.venue = venue
+        self.fetch = fetch
+        self.inverted = inverted
+
+
+class RateMatrix:
+    """
+    Фоновая матрица кросс-курсов по всем площадкам бота.
+
+    На каждом обновлении все источники опрашиваются параллельно, затем одним
+    векторным проходом считаются средние курсы валют, спреды между
+    площадками и полная матрица кросс-курсов (в том числе RUB/CNY через
+    USDT). Готовый текст ответа собирается сразу, поэтому пункт меню
+    отвечает без запросов к биржам.
+    """
+
+    def __init__(self, sources, interval: float = 30.0):
+        """
+        :param sources: Список RateSource.
+        :param interval: Интервал обновления в секундах.
+        """
+        self.sources = sources
+        self.interval = interval
+        self.quotes = None  # Матрица валюта x источник, NaN - нет котировки
+        self.mid = None  # Средний курс: единиц валюты за 1 USDT
+        self.spread = None  # Спред между площадками в процентах
+        self.cross = None  # cross[i, j] - сколько валюты j за 1 единицу валюты i
+        self.updated_at = None
+        self.text = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    async def _fetch(self, source: RateSource):
+        value = await source.fetch()
+        if value is None or value <= 0:
+            return np.nan
+        return 1.0 / value if source.inverted else value
+
+    def compute(self, values):
+        """
+        Пересчитывает матрицу по значениям источников (в порядке self.sources).
+        """
+        quotes = np.full((len(CURRENCIES), len(self.sources)), np.nan)
+        rows = np.array([CURRENCIES.index(source.currency) for source in self.sources])
+        quotes[rows, np.arange(len(self.sources))] = values
+
+        with warnings.catch_warnings():
+            # Строки без котировок (все значения NaN) дают RuntimeWarning numpy
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mid = np.nanmean(quotes, axis=1)
+            spread = (np.nanmax(quotes, axis=1) - np.nanmin(quotes, axis=1)) / mid * 100
+        mid[CURRENCIES.index("USDT")] = 1.0
+        cross = mid[np.newaxis, :] / mid[:, np.newaxis]
+
+        self.quotes, self.mid, self.spread, self.cross = quotes, mid, spread, cross
+        self.updated_at = time.time()
+        self.text = self._format()
+
+    async def refresh(self):
+        """
+        Опрашивает все источники параллельно и пересчитывает матрицу.
+        """
+        results = await asyncio.gather(*(self._fetch(s) for s in self.sources), return_exceptions=True)
+        values = np.empty(len(self.sources))
+        for index, (source, result) in enumerate(zip(self.sources, results)):
+            if isinstance(result, Exception):
+                logger.warning(f"Rate matrix: {source.currency} ({source.venue}) unavailable: {result}")
+                values[index] = np.nan
+            else:
+                values[index] = result
+        self.compute(values)
+
+    async def current(self):
+        """
+        Текст матрицы. Если фоновое обновление в этом процессе не запущено
+        (воркер без фоновых задач), матрица пересчитывается по запросу,
+        но не чаще одного раза за interval.
+        """
+        if self._task is None and self.interval > 0:
+            async with self._lock:
+                if self.updated_at is None or time.time() - self.updated_at >= self.interval:
+                    await self.refresh()
+        return self.text
+
+    def rate(self, base: str, quote: str):
+        """
+        Сколько quote за 1 base (например, rate("USDT", "RUB")) или None.
+        """
+        if self.cross is None:
+            return None
+        value = self.cross[CURRENCIES.index(base), CURRENCIES.index(quote)]
+        return None if np.isnan(value) else float(value)
+
+    def _format(self):
+        lines = ["📊 *Cross rates*", ""]
+
+        # Котировки источников и спреды между площадками
+        for row, currency in enumerate(CURRENCIES):
+            if currency == "USDT":
+                continue
+            columns = [i for i, s in enumerate(self.sources) if s.currency == currency]
+            if currency in ("RUB", "CNY"):
+                title = f"USDT/{currency}"
+                values = self.quotes[row, columns]
+                mid = self.mid[row]
+            else:
+                title = f"{currency}/USDT"
+                values = 1.0 / self.quotes[row, columns]
+                mid = 1.0 / self.mid[row]
+            if np.isnan(mid):
+                lines.append(f"*{title}*: no data")
+                continue
+            venues = " · ".join(
+                f"{self.sources[i].venue} {_format_rate(v)}" for i, v in zip(columns, values) if not np.isnan(v))
+            spread = "" if np.count_nonzero(~np.isnan(values)) < 2 or np.isnan(self.spread[row]) else f", spread {self.spread[row]:.2f}%"
+            lines.append(f"*{title}*: {_format_rate(mid)}{spread}")
+            lines.append(f"   {venues}")
+
+        # Кросс-курсы через USDT
+        lines.extend(["", "🔁 *Implied via USDT:*"])
+        for base, quote in (("CNY", "RUB"), ("TON", "RUB"), ("BTC", "RUB"), ("ETH", "RUB"), ("BTC", "CNY"), ("ETH", "BTC")):
+            value = self.rate(base, quote)
+            lines.append(f"{base}/{quote}: {_format_rate(value) if value is not None else '—'}")
+
+        # Полная матрица: строка - база, столбец - котируемая валюта
+        lines.extend(["", "```", "      " + "".join(f"{c:>9}" for c in CURRENCIES)])
+        for row, base in enumerate(CURRENCIES):
+            cells = "".join(f"{_format_cell(v):>9}" for v in self.cross[row])
+            lines.append(f"{base:<6}{cells}")
+        lines.append("```")
+        lines.append(f"🕒 {time.strftime('%H:%M:%S', time.localtime(self.updated_at))}")
+        return "\n".join(lines)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing rate matrix: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """
+        Запускает обновление по расписанию (вызывается при запуске диспетчера).
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает обновление (вызывается при остановке диспетчера).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def _format_rate(value: float):
+    """
+    Курс с разумным числом знаков (65000.5, 95.42, 0.1818).
+    """
+    if value >= 1000:
+        return f"{value:,.0f}"
+    if value >= 1:
+        return f"{value:.2f}"
+    return f"{value:.4g}"
+
+
+def _format_cell(value: float):
+    if np.isnan(value):
+        return "—"
+    if value >= 1e6 or value < 1e-3:
+        return f"{value:.2e}"
+    if value >= 1000:
+        return f"{value:.0f}"
+    return f"{value:.4g}"
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+
+from keyboards import get_inline_bybit_keyboard, get_inline_huobi_keyboard
+from inline_engine import format_ticker_text
+from metrics import record_cache
+from resilience import format_stale
+
+
+class RenderCache:
+    """
+    Кеш готовых ответов: ключ (вид, площадка, сторона, версия снимка) ->
+    (текст, клавиатура).
+
+    Версия снимка - кортеж значений, из которых собирается текст, поэтому
+    одинаковые котировки для всех пользователей рендерятся один раз, а новая
+    котировка автоматически получает новый ключ. Старые ключи вытесняются (LRU).
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def get(self, key, build):
+        """
+        Возвращает ответ из кеша или строит его через build() и запоминает.
+        """
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+            record_cache("render", True)
+            return item
+        record_cache("render", False)
+        item = self._items[key] = build()
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return item
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _mark_stale(rendered, data: dict):
+    """
+    Добавляет пометку о сохраненных данных (не кешируется - возраст меняется).
+    """
+    if data and data.get('stale_age') is not None:
+        text, keyboard = rendered
+        return f"{text}\n\n{format_stale(data['stale_age'])}", keyboard
+    return rendered
+
+
+def render_spot(data: dict):
+    """
+    Котировка спотовой пары с клавиатурой Bybit.
+
+    :return: Кортеж (текст, клавиатура).
+    """
+    version = (data['lastPrice'], data['highPrice24h'], data['lowPrice24h'])
+    return _mark_stale(render_cache.get(
+        ("spot", "bybit", data['symbol'], version),
+        lambda: (format_ticker_text(data), get_inline_bybit_keyboard()),
+    ), data)
+
+
+def render_bybit_p2p(action: str, parsed: dict):
+    """
+    P2P-котировка USDT/RUB Bybit с клавиатурой Bybit.
+
+    :return: Кортеж (текст, клавиатура).
+    """
+    def build():
+        if not parsed:
+            return "Data not found or response structure is different.", get_inline_bybit_keyboard()
+        return (
+            f"✅ {action.upper()} Rate - USDT/RUB:\n"
+            f"📈 Max price: {parsed['max_price']} ₽\n"
+            f"📉 Min price: {parsed['min_price']} ₽\n"
+            f"📊 Average price: {parsed['avg_price']:.2f} ₽"
+        ), get_inline_bybit_keyboard()
+
+    version = (parsed['min_price'], parsed['max_price'], parsed['avg_price']) if parsed else None
+    return _mark_stale(render_cache.get(("p2p", "bybit", action, version), build), parsed)
+
+
+def render_huobi_p2p(trade_type: str, parsed: dict):
+    """
+    P2P-котировка USDT/CNY Huobi с клавиатурой Huobi.
+
+    :return: Кортеж (текст, клавиатура).
+    """
+    side = trade_type.upper()
+
+    def build():
+        if not parsed:
+            return (f"🇨🇳 Huobi P2P ({side}):\n\n❌ No offers found for the specified amount.",
+                    get_inline_huobi_keyboard())
+        return (
+            f"🇨🇳 Huobi P2P Data ({side}):\n\n"
+            f"📉 Min Price: {parsed['min_price']} CNY\n"
+            f"📈 Max Price: {parsed['max_price']} CNY\n"
+            f"📊 Avg Price: {parsed['avg_price']:.2f} CNY\n"
+            f"🔵 Alipay Offers: {parsed['alipay_count']}/10\n"
+            f"🟢 WeChat Offers: {parsed['wechat_count']}/10"
+        ), get_inline_huobi_keyboard()
+
+    version = (
+        parsed['min_price'], parsed['max_price'], parsed['avg_price'],
+        parsed['alipay_count'], parsed['wechat_count'],
+    ) if parsed else None
+    return _mark_stale(render_cache.get(("p2p", "huobi", trade_type, version), build), parsed)
+
+
+# Общий кеш отрендеренных ответов
+render_cache = RenderCache()
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from metrics import registry, Counter
+
+logger = logging.getLogger(__name__)
+
+# Бюджеты площадок по умолчанию: venue -> (бюджет на вызов, задержка перед хеджированным запросом), в секундах.
+# Переопределяются через UPSTREAM_BUDGET_<VENUE> и UPSTREAM_HEDGE_<VENUE> в .env.
+VENUE_DEFAULTS = {
+    "bybit_spot": (3.0, 0.5),
+    "bybit_p2p": (5.0, 1.0),
+    "htx": (5.0, 1.0),
+    "binance": (3.0, 0.5),
+}
+
+# Коды ошибок Bybit, которые относятся к самой площадке (таймаут, лимиты, внутренняя ошибка)
+BYBIT_VENUE_ERROR_CODES = {10000, 10006, 10016, 10018}
+
+upstream_events = registry.register(Counter(
+    "bot_upstream_events_total", "События слоя устойчивости (hedge, timeout, stale, rejected, request_error)",
+    labels=("venue", "event")))
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Площадка недоступна, а сохраненного значения нет.
+    """
+
+
+class UpstreamRequestError(Exception):
+    """
+    Ошибка самого запроса (неизвестный символ, неверные параметры): площадка работает.
+    """
+
+
+def is_request_error(error: Exception):
+    """
+    Относится ли ошибка к запросу, а не к площадке. Такие ошибки не
+    хеджируются, не учитываются автоматом защиты и не подменяются
+    сохраненным значением.
+    """
+    if isinstance(error, UpstreamRequestError):
+        return True
+    if isinstance(error, aiohttp.ClientResponseError):
+        return 400 <= error.status < 500 and error.status not in (408, 429)
+    # pybit импортируется лениво: если модуль не загружен, ошибка не из него
+    pybit_exceptions = sys.modules.get("pybit.exceptions")
+    if pybit_exceptions is not None and isinstance(error, pybit_exceptions.InvalidRequestError):
+        return error.status_code not in BYBIT_VENUE_ERROR_CODES
+    return False
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты: после failure_threshold ошибок подряд размыкается на
+    reset_timeout секунд. Затем пропускает один пробный вызов: успех
+    замыкает автомат, ошибка размыкает снова.
+    """
+
+    __slots__ = ("failure_threshold", "reset_timeout", "failures", "opened_at", "trial")
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False  # Выполняется пробный вызов
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """
+        Можно ли выполнить вызов сейчас.
+        """
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def release(self):
+        """
+        Вызов завершился без вывода о площадке (отмена, ошибка запроса): пробный вызов можно повторить.
+        """
+        self.trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial = False
+
+
+class Upstream:
+    """
+    Вызовы одной площадки с бюджетом времени, хеджированием, автоматом
+    защиты и отдачей последнего удачного значения (stale-while-revalidate).
+
+    Если первый запрос не ответил за hedge_after секунд (или сразу упал),
+    параллельно отправляется второй; используется первый успешный ответ.
+    Весь вызов ограничен budget секундами. Пока площадка недоступна, по
+    тому же ключу отдается последнее удачное значение с его возрастом.
+    """
+
+    def __init__(self, venue: str, budget: float, hedge_after: float, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, stale_max_age: float = 900.0, max_keys: int = 1024):
+        """
+        :param venue: Название площадки (для логов и метрик).
+        :param budget: Максимальное время вызова в секундах.
+        :param hedge_after: Через сколько секунд отправлять второй запрос (>= budget - без хеджирования).
+        :param failure_threshold: Сколько ошибок подряд размыкают автомат.
+        :param reset_timeout: Через сколько секунд пробовать площадку снова.
+        :param stale_max_age: Максимальный возраст значения, которое можно отдать вместо ошибки.
+        :param max_keys: Сколько последних значений хранить.
+        """
+        self.venue = venue
+        self.budget = budget
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.stale_max_age = stale_max_age
+        self.max_keys = max_keys
+        self._last = OrderedDict()  # key -> (время получения, значение)
+
+    def _remember(self, key, value):
+        self._last[key] = (time.monotonic(), value)
+        self._last.move_to_end(key)
+        if len(self._last) > self.max_keys:
+            self._last.popitem(last=False)
+
+    def _stale(self, key, error: Exception):
+        """
+        Возвращает (значение, возраст) последнего удачного ответа или поднимает ошибку.
+        """
+        entry = self._last.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age <= self.stale_max_age:
+                upstream_events.inc(self.venue, "stale")
+                return entry[1], age
+        if isinstance(error, UpstreamUnavailable):
+            raise error
+        raise UpstreamUnavailable(f"{self.venue} is unavailable: {error or 'timeout'}") from error
+
+    async def _hedged(self, factory):
+        started = time.monotonic()
+        tasks = [asyncio.create_task(factory())]
+        try:
+            while True:
+                for task in tasks:
+                    if task.done() and not task.cancelled():
+                        if task.exception() is None:
+                            return task.result()
+                        # Ошибку запроса повторный запрос не исправит
+                        if is_request_error(task.exception()):
+                            raise task.exception()
+                pending = [task for task in tasks if not task.done()]
+                elapsed = time.monotonic() - started
+                if len(tasks) < 2 and (not pending or elapsed >= self.hedge_after) and elapsed < self.budget:
+                    upstream_events.inc(self.venue, "hedge")
+                    tasks.append(asyncio.create_task(factory()))
+                    continue
+                if not pending:
+                    raise tasks[0].exception()
+                remaining = self.budget - elapsed
+                if remaining <= 0:
+                    upstream_events.inc(self.venue, "timeout")
+                    raise asyncio.TimeoutError(f"{self.venue} did not respond in {self.budget:g}s")
+                if len(tasks) < 2:
+                    remaining = min(remaining, self.hedge_after - elapsed)
+                await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def call(self, key, factory):
+        """
+        Выполняет вызов площадки.
+
+        :param key: Ключ значения (символ, ключ P2P-запроса и т.п.).
+        :param factory: Функция без аргументов, возвращающая корутину запроса.
+        :return: Кортеж (значение, возраст в секундах). Возраст равен None для
+                 свежего ответа и задан, если отдано сохраненное значение.
+        :raises UpstreamUnavailable: если площадка недоступна и сохраненного значения нет.
+        :raises Exception: ошибка запроса (см. is_request_error) передается как есть.
+        """
+        if not self.breaker.allow():
+            upstream_events.inc(self.venue, "rejected")
+            return self._stale(key, UpstreamUnavailable(f"{self.venue} is temporarily unavailable"))
+        try:
+            value = await self._hedged(factory)
+        except asyncio.CancelledError:
+            # Вызывающий отменил запрос - это не ошибка площадки
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if is_request_error(e):
+                upstream_events.inc(self.venue, "request_error")
+                self.breaker.release()
+                raise
+            self.breaker.record_failure()
+            logger.warning(f"Upstream {self.venue} failed ({self.breaker.state}): {e!r}")
+            return self._stale(key, e)
+        self.breaker.record_success()
+        self._remember(key, value)
+        return value, None
+
+
+def format_stale(age: float):
+    """
+    Пометка для ответа, собранного из сохраненных данных.
+    """
+    return f"⚠ Exchange is not responding, showing data from {int(age)}s ago"
+
+
+_upstreams = {}
+
+
+def upstream(venue: str):
+    """
+    Возвращает общий объект Upstream площадки (настройки из .env).
+    """
+    instance = _upstreams.get(venue)
+    if instance is None:
+        budget, hedge_after = VENUE_DEFAULTS.get(venue, (5.0, 1.0))
+        name = venue.upper()
+        instance = _upstreams[venue] = Upstream(
+            venue,
+            budget=float(os.getenv(f'UPSTREAM_BUDGET_{name}', budget)),
+            hedge_after=float(os.getenv(f'UPSTREAM_HEDGE_{name}', hedge_after)),
+            failure_threshold=int(os.getenv('UPSTREAM_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.getenv('UPSTREAM_BREAKER_RESET', '30')),
+            stale_max_age=float(os.getenv('UPSTREAM_STALE_MAX_AGE', '900')),
+        )
+    return instance
+
+
+def _collect_breakers():
+    """
+    Состояние автоматов защиты для /metrics (0 - замкнут, 1 - полуоткрыт, 2 - разомкнут).
+    """
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    lines = ["# HELP bot_upstream_breaker_state Состояние автомата защиты площадки",
+             "# TYPE bot_upstream_breaker_state gauge"]
+    for venue, instance in _upstreams.items():
+        lines.append(f'bot_upstream_breaker_state{{venue="{venue}"}} {states[instance.breaker.state]}')
+    return lines
+
+
+registry.add_collector(_collect_breakers)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+def shard_key(update: Update) -> int:
+    """
+    Возвращает ключ шардирования обновления: id чата (или пользователя).
+    Все обновления одного чата попадают в один и тот же воркер.
+    """
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message is not None:
+            return message.chat.id
+    if update.callback_query is not None:
+        callback = update.callback_query
+        return callback.message.chat.id if callback.message else callback.from_user.id
+    if update.inline_query is not None:
+        return update.inline_query.from_user.id
+    if update.chosen_inline_result is not None:
+        return update.chosen_inline_result.from_user.id
+    return update.update_id
+
+
+async def _worker_main(queue, index: int):
+    """
+    Цикл воркера: получает обновления своего шарда и передает их диспетчеру.
+    """
+    # Номер воркера читается в bot.py при импорте: фоновые задачи (опрос бирж,
+    # проверка и отправка алертов) выполняет только воркер 0. Переменная задается
+    # и родителем до запуска процесса: spawn выполняет главный модуль раньше этой функции
+    os.environ['BOT_SHARD'] = str(index)
+    import bot as app
+
+    # Кеши котировок прогреваются с диска в каждом воркере, сохраняет их воркер 0
+    app.setup_quote_store()
+    app.setup_dispatcher()
+    await app.dp.emit_startup(bot=app.bot, dispatcher=app.dp)
+    tasks = set()
+    try:
+        while True:
+            raw = await asyncio.to_thread(queue.get)
+            if raw is None:
+                break
+            update = Update.model_validate(raw, context={"bot": app.bot})
+            task = asyncio.create_task(app.dp.feed_update(app.bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await app.dp.emit_shutdown(bot=app.bot, dispatcher=app.dp)
+        await app.bot.session.close()
+
+
+def _worker_process(queue, index: int):
+    """
+    Точка входа процесса-воркера.
+    """
+    asyncio.run(_worker_main(queue, index))
+
+
+async def run_sharded_polling(bot: Bot, dp: Dispatcher, workers: int):
+    """
+    Получает обновления через long polling и распределяет их по процессам-воркерам
+    по id чата. Для общего состояния FSM между воркерами используйте
+    FSM_STORAGE=redis или FSM_STORAGE=sqlite.
+
+    :param bot: Экземпляр бота (используется только для getUpdates).
+    :param dp: Диспетчер (нужен для списка используемых типов обновлений).
+    :param workers: Количество процессов-воркеров.
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(workers)]
+    # Воркеры не daemon: им нужны свои дочерние процессы (пул отрисовки графиков),
+    # поэтому при остановке они завершаются явно
+    processes = [context.Process(target=_worker_process, args=(q, index)) for index, q in enumerate(queues)]
+    for index, process in enumerate(processes):
+        os.environ['BOT_SHARD'] = str(index)
+        process.start()
+    os.environ.pop('BOT_SHARD', None)
+    logger.info(f"Started {workers} worker processes")
+
+    await bot.delete_webhook(drop_pending_updates=True)
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+            except Exception as e:
+                logger.error(f"Error in get_updates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                queue = queues[shard_key(update) % workers]
+                queue.put(update.model_dump(mode="json", exclude_unset=True))
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            await asyncio.to_thread(process.join, 10)
+            if process.is_alive():
+                logger.warning(f"Worker {process.pid} did not stop in time, terminating")
+                process.terminate()
+                await asyncio.to_thread(process.join, 5)
+        await bot.session.close()
@@ -1,24 +1,140 @@
-import requests
+import asyncio
+import time
 
+import aiohttp
+import numpy as np
+
+from http_session import get_session
+from coalesce import RequestCoalescer
+from metrics import track_upstream, record_cache
+from resilience import upstream
+
+# Адрес API Binance для получения цены пары
+BINANCE_PRICE_URL = "https://api.binance.com/api/v3/ticker/price"
+
+# Таймаут на один запрос к Binance (в секундах)
+BINANCE_TIMEOUT = aiohttp.ClientTimeout(total=5, connect=3)
+
+# Время жизни кеша для каждой пары (в секундах)
+LEG_TTL = {
+    "TONUSDT": 10.0,
+    "USDTRUB": 60.0,
+}
+
+# Названия пар для сообщений об ошибках
+LEG_NAMES = {
+    "TONUSDT": "TON/USDT",
+    "USDTRUB": "USDT/RUB",
+}
+
+# Эталонная цена одной звезды (в рублях)
+STANDARD_STAR_PRICE = 1.65
+
+# Максимальное количество ячеек в таблице (ограничение длины сообщения Telegram)
+MAX_GRID_CELLS = 60
+
+# Кеш цен пар: symbol -> (время получения, цена)
+_leg_cache = {}
+
+# Объединение одновременных запросов одной и той же пары
+_binance_coalescer = RequestCoalescer()
+
+
+class TonPriceError(Exception):
+    """
+    Не удалось получить цену TON/RUB.
+    """
+
+
+async def _fetch_binance_price(symbol: str):
+    """
+    Запрашивает текущую цену пары на Binance.
+
+    :param symbol: Символ пары (например, "TONUSDT").
+    :return: Цена (float).
+    """
+    session = get_session()
+    async with track_upstream("binance"):
+        async with session.get(BINANCE_PRICE_URL, params={"symbol": symbol}, timeout=BINANCE_TIMEOUT) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+    price = data.get("price")
+    if not price:
+        raise TonPriceError(f"Не удалось получить цену {LEG_NAMES.get(symbol, symbol)}")
+    return float(price)
+
+
+async def get_leg_price(symbol: str):
+    """
+    Возвращает цену пары из кеша или запрашивает ее на Binance.
+
+    :param symbol: Символ пары (например, "TONUSDT").
+    :return: Кортеж (цена, возраст). Возраст задан, если Binance недоступен
+             и отдана последняя удачная цена, иначе None.
+    """
+    entry = _leg_cache.get(symbol)
+    hit = entry is not None and time.monotonic() - entry[0] < LEG_TTL.get(symbol, 10.0)
+    record_cache("binance_legs", hit)
+    if hit:
+        return entry[1], None
+
+    price, stale_age = await _binance_coalescer.run(
+        symbol, lambda: upstream("binance").call(symbol, lambda: _fetch_binance_price(symbol)))
+    if stale_age is None:
+        _leg_cache[symbol] = (time.monotonic(), price)
+    return price, stale_age
+
+
+def dump_leg_cache():
+    """
+    Цены пар для снимка на диске: список (символ, возраст, цена).
+    """
+    now = time.monotonic()
+    return [(symbol, now - fetched, price) for symbol, (fetched, price) in _leg_cache.items()]
 
-def get_ton_rub_price():
-    try:
-        # Получаем курс TON/USDT
-        ton_usdt = requests.get("https://api.binance.com/api/v3/ticker/price?symbol=TONUSDT").json().get("price")
-        if not ton_usdt:
-            raise ValueError("Не удалось получить цену TON/USDT")
 
-        # Получаем курс USDT/RUB
-        usdt_rub = requests.get("https://api.binance.com/api/v3/ticker/price?symbol=USDTRUB").json().get("price")
-        if not usdt_rub:
-            raise ValueError("Не удалось получить цену USDT/RUB")
+def restore_leg_cache(entries):
+    """
+    Восстанавливает цены пар из снимка; цены старше TTL пары пропускаются.
+    """
+    now = time.monotonic()
+    for symbol, age, price in entries:
+        if age < LEG_TTL.get(symbol, 10.0):
+            _leg_cache[symbol] = (now - age, price)
 
-        # Рассчитываем цену TON/RUB
-        ton_rub = float(ton_usdt) * float(usdt_rub)
-        return round(ton_rub, 2)
 
+async def get_ton_rub_quote():
+    """
+    Рассчитывает цену TON/RUB через TON/USDT и USDT/RUB.
+    Обе пары запрашиваются одновременно и кешируются отдельно.
+
+    :return: Кортеж (цена TON/RUB, округленная до 2 знаков; возраст самой старой
+             из пар в секундах, если использована сохраненная цена, иначе None).
+    :raises TonPriceError: если не удалось получить одну из цен.
+    """
+    try:
+        (ton_usdt, ton_age), (usdt_rub, rub_age) = await asyncio.gather(
+            get_leg_price("TONUSDT"),
+            get_leg_price("USDTRUB"),
+        )
+    except TonPriceError:
+        raise
     except Exception as e:
-        return f"Ошибка: {e}"
+        raise TonPriceError(str(e)) from e
+
+    # Рассчитываем цену TON/RUB
+    ton_rub = ton_usdt * usdt_rub
+    ages = [age for age in (ton_age, rub_age) if age is not None]
+    return round(ton_rub, 2), max(ages) if ages else None
+
+
+def total_difference(price_difference, stars_count):
+    """
+    Общая разница с курсом: разница за 1 звезду сначала округляется до 2 знаков,
+    затем умножается на количество звезд. Работает и с числами, и с массивами numpy,
+    поэтому одиночный расчет и таблица считают одинаково.
+    """
+    return np.round(np.round(price_difference, 2) * stars_count, 2)
 
 
 def calculate_star_price(ton_price, stars_to_ton_ratio, stars_count=100):
@@ -35,7 +151,7 @@ def calculate_star_price(ton_price, stars_to_ton_ratio, stars_count=100):
         star_price = total_price_for_stars / stars_count  # Цена за одну звезду
 
         # Расчет по курсу 1.65
-        standard_price_per_star = 1.65
+        standard_price_per_star = STANDARD_STAR_PRICE
         total_standard_price = standard_price_per_star * stars_count
         price_difference = standard_price_per_star - star_price
 
@@ -44,7 +160,63 @@ def calculate_star_price(ton_price, stars_to_ton_ratio, stars_count=100):
             'total_price': round(total_price_for_stars, 2),
             'standard_price': round(total_standard_price, 2),
             'price_difference': round(price_difference, 2),
+            'total_difference': float(total_difference(price_difference, stars_count)),
             'ton_price': round(ton_price, 2)
         }
     except Exception as e:
-        return f"Ошибка расчета: {e}"
\ No newline at end of file
+        return f"Ошибка расчета: {e}"
+
+
+def calculate_star_price_grid(ton_price, ratios, counts):
+    """
+    Векторный расчет цены звезд для всех сочетаний курсов и количеств.
+    Формулы совпадают с calculate_star_price. Значения не округляются
+    (округление делается при выводе), кроме общей разницы: она считается
+    через total_difference, как и в calculate_star_price.
+
+    :param ton_price: цена за 1 TON в рублях
+    :param ratios: список курсов (сколько TON за звезды)
+    :param counts: список количеств звезд
+    :return: словарь массивов формы (len(ratios), len(counts))
+    """
+    ratios = np.asarray(ratios, dtype=np.float64)[:, np.newaxis]
+    counts = np.asarray(counts, dtype=np.float64)[np.newaxis, :]
+
+    total_price = ton_price * ratios * np.ones_like(counts)  # Цена за все звезды
+    star_price = total_price / counts  # Цена за одну звезду
+    standard_price = STANDARD_STAR_PRICE * counts * np.ones_like(ratios)
+    price_difference = STANDARD_STAR_PRICE - star_price
+
+    return {
+        'star_price': star_price,
+        'total_price': total_price,
+        'standard_price': standard_price,
+        'price_difference': price_difference,
+        'total_difference': total_difference(price_difference, counts),
+    }
+
+
+def format_star_price_table(ton_price, ratios, counts):
+    """
+    Формирует компактную таблицу цен звезд для всех сочетаний курсов и количеств.
+
+    :param ton_price: цена за 1 TON в рублях
+    :param ratios: список курсов (сколько TON за звезды)
+    :param counts: список количеств звезд
+    :return: текст таблицы в Markdown
+    """
+    grid = calculate_star_price_grid(ton_price, ratios, counts)
+
+    lines = [f"{'TON':>6} {'⭐':>6} {'₽/⭐':>6} {'Итого':>9} {'Δ/⭐':>6} {'Δ итого':>9}"]
+    for i, ratio in enumerate(ratios):
+        for j, count in enumerate(counts):
+            lines.append(
+                f"{ratio:>6g} {count:>6d} {grid['star_price'][i, j]:>6.2f} {grid['total_price'][i, j]:>9.2f} "
+                f"{grid['price_difference'][i, j]:>6.2f} {grid['total_difference'][i, j]:>9.2f}"
+            )
+
+    return (
+        f"📊 *Таблица цен звезд* (Δ - разница с курсом {STANDARD_STAR_PRICE} ₽/звезда)\n"
+        f"```\n" + "\n".join(lines) + "\n```\n"
+        f"💎 *Текущая цена TON/RUB:* {round(ton_price, 2)} ₽"
+    )
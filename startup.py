@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Шаги инициализации: (название, время в секундах с предыдущей отметки)
+_steps = []
+_last_mark = time.perf_counter()
+
+# Строка вывода python -X importtime: "import time: <self> | <cumulative> | <отступ><модуль>"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)$")
+
+
+class LazyClient:
+    """
+    Клиент, который создается при первом обращении к его атрибутам.
+
+    Тяжелые клиенты бирж (pybit тянет за собой requests) не нужны для
+    старта бота: они создаются при первом запросе, а так как запросы pybit
+    выполняются в asyncio.to_thread, импорт и создание клиента тоже
+    происходят в отдельном потоке и не блокируют цикл событий.
+    """
+
+    def __init__(self, factory):
+        """
+        :param factory: Функция без аргументов, создающая клиент.
+        """
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_client", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                client = self._client
+                if client is None:
+                    client = self._factory()
+                    object.__setattr__(self, "_client", client)
+        return client
+
+    @property
+    def created(self):
+        return self._client is not None
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
+
+
+def mark(step: str):
+    """
+    Отмечает завершение шага инициализации (для --profile-startup).
+    """
+    global _last_mark
+    now = time.perf_counter()
+    _steps.append((step, now - _last_mark))
+    _last_mark = now
+
+
+def dump_steps():
+    """
+    Печатает шаги инициализации в stdout (вызывается в профилируемом процессе).
+    """
+    print(json.dumps(_steps))
+
+
+def parse_importtime(output: str):
+    """
+    Разбирает вывод python -X importtime.
+
+    :return: Список (модуль, собственное время, полное время, глубина); время в секундах.
+    """
+    rows = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            rows.append((module, int(own) / 1e6, int(cumulative) / 1e6, (len(indent) - 1) // 2))
+    return rows
+
+
+def profile_startup(module: str = "bot", top: int = 15):
+    """
+    Импортирует module в отдельном процессе с -X importtime и печатает отчет:
+    время импорта модулей проекта, самые тяжелые внешние пакеты и шаги
+    инициализации, отмеченные через mark().
+
+    :return: Код возврата профилируемого процесса.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    local = {name[:-3] for name in os.listdir(root) if name.endswith(".py")}
+    code = f"import startup, {module}; {module}.setup_dispatcher(); startup.mark('routers'); startup.dump_steps()"
+
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=root, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        return result.returncode
+
+    rows = parse_importtime(result.stderr)
+    steps = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # Внешние пакеты: собственное время всех подмодулей суммируется по корневому пакету
+    packages = {}
+    for name, own, _, _ in rows:
+        package = name.split(".")[0]
+        if package not in local:
+            packages[package] = packages.get(package, 0.0) + own
+
+    print(f"Startup of {module}: {wall * 1000:.0f} ms wall (including interpreter start)\n")
+    print("Project modules (own / cumulative, ms):")
+    for name, own, cumulative, _ in sorted((r for r in rows if r[0] in local), key=lambda r: -r[2]):
+        print(f"  {name:<20} {own * 1000:8.1f} {cumulative * 1000:9.1f}")
+    print(f"\nHeaviest packages (own time of all submodules, ms), top {top}:")
+    for package, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<20} {own * 1000:8.1f}")
+    print("\nInit steps (ms):")
+    for step, seconds in steps:
+        print(f"  {step:<20} {seconds * 1000:8.1f}")
+    return 0
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from metrics import track_upstream, record_cache
+from resilience import upstream, UpstreamRequestError
+
+
+class TickerCache:
+    """
+    Кеш спотовых тикеров Bybit с временем жизни (TTL) и объединением запросов.
+
+    Пока данные по символу свежие, они отдаются из памяти. Если данные устарели,
+    то в бирже выполняется ровно один запрос, а все одновременные обращения
+    к тому же символу ждут его результат.
+    """
+
+    def __init__(self, session, ttl: float = 2.0):
+        """
+        :param session: Сессия pybit (HTTP) для запросов к Bybit.
+        :param ttl: Время жизни данных в секундах.
+        """
+        self.session = session
+        self.ttl = ttl
+        self._entries = {}  # symbol -> (время получения, данные тикера)
+        self._inflight = {}  # symbol -> asyncio.Future с текущим запросом
+
+    def _fetch(self, symbol: str):
+        """
+        Блокирующий запрос тикера через pybit (выполняется в отдельном потоке).
+        """
+        response = self.session.get_tickers(category="spot", symbol=symbol)
+        items = response['result']['list']
+        if not items:
+            raise UpstreamRequestError(f"Unknown symbol: {symbol}")
+        return items[0]
+
+    def peek(self, symbol: str):
+        """
+        Возвращает свежие данные из кеша без запроса к бирже или None.
+        """
+        entry = self._entries.get(symbol)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    async def _fetch_tracked(self, symbol: str):
+        async with track_upstream("bybit_spot"):
+            return await asyncio.to_thread(self._fetch, symbol)
+
+    async def get(self, symbol: str):
+        """
+        Возвращает данные тикера для символа (например, "BTCUSDT").
+
+        :param symbol: Символ спотовой пары.
+        :return: Словарь с полями symbol, lastPrice, highPrice24h, lowPrice24h и т.д.
+                 Если Bybit недоступен и отдан последний удачный ответ, в словаре
+                 есть поле stale_age (возраст данных в секундах).
+        """
+        symbol = symbol.upper()
+        data = self.peek(symbol)
+        record_cache("bybit_spot", data is not None)
+        if data is not None:
+            return data
+
+        # Если запрос уже выполняется - ждем его результат
+        future = self._inflight.get(symbol)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[symbol] = future
+        try:
+            data, stale_age = await upstream("bybit_spot").call(symbol, lambda: self._fetch_tracked(symbol))
+            if stale_age is None:
+                self._entries[symbol] = (time.monotonic(), data)
+            else:
+                data = dict(data, stale_age=stale_age)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение как полученное, если никто больше не ждет
+            future.exception()
+            raise
+        finally:
+            del self._inflight[symbol]
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from metrics import track_upstream, record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TickerTable:
+    """
+    Таблица всех спотовых тикеров Bybit в столбцовом виде.
+
+    Весь рынок загружается одним запросом get_tickers(category="spot") по
+    расписанию. Символ отображается в номер строки, цены хранятся в
+    параллельных массивах float64. Новая таблица собирается целиком и
+    подменяется одной операцией, поэтому читатели не видят частичных данных.
+    """
+
+    def __init__(self, session, interval: float = 5.0, stale_after: float = None):
+        """
+        :param session: Сессия pybit (HTTP) для запросов к Bybit.
+        :param interval: Интервал обновления в секундах.
+        :param stale_after: Через сколько секунд таблица считается устаревшей
+                            (по умолчанию три интервала).
+        """
+        self.session = session
+        self.interval = interval
+        self.stale_after = stale_after if stale_after is not None else interval * 3
+        self._rows = {}  # symbol -> номер строки
+        self._last = np.empty(0)
+        self._high = np.empty(0)
+        self._low = np.empty(0)
+        self.updated_at = None
+        self._task = None
+
+    def _fetch(self):
+        response = self.session.get_tickers(category="spot")
+        return response['result']['list']
+
+    def load(self, items):
+        """
+        Строит новую таблицу из списка тикеров Bybit и подменяет текущую.
+        """
+        count = len(items)
+        rows = {}
+        last = np.empty(count)
+        high = np.empty(count)
+        low = np.empty(count)
+        for row, item in enumerate(items):
+            rows[item['symbol']] = row
+            last[row] = float(item['lastPrice'] or "nan")
+            high[row] = float(item['highPrice24h'] or "nan")
+            low[row] = float(item['lowPrice24h'] or "nan")
+        self._rows, self._last, self._high, self._low = rows, last, high, low
+        self.updated_at = time.monotonic()
+
+    def dump_state(self):
+        """
+        Таблица для снимка на диске: одна запись ("spot", возраст, [[символ, last, high, low], ...]).
+        """
+        if self.updated_at is None:
+            return []
+        items = [[symbol, self._last[row], self._high[row], self._low[row]] for symbol, row in self._rows.items()]
+        return [("spot", time.monotonic() - self.updated_at, items)]
+
+    def restore_state(self, entries):
+        """
+        Восстанавливает таблицу из снимка, если он не устарел и таблица еще пуста.
+        """
+        for key, age, items in entries:
+            if key != "spot" or age > self.stale_after or self.updated_at is not None:
+                continue
+            self.load([{'symbol': symbol, 'lastPrice': last, 'highPrice24h': high, 'lowPrice24h': low}
+                       for symbol, last, high, low in items])
+            self.updated_at = time.monotonic() - age
+
+    async def refresh(self):
+        """
+        Загружает весь спотовый рынок одним запросом.
+        """
+        async with track_upstream("bybit_spot_bulk"):
+            items = await asyncio.to_thread(self._fetch)
+        self.load(items)
+
+    def is_fresh(self):
+        return self.updated_at is not None and time.monotonic() - self.updated_at <= self.stale_after
+
+    def __contains__(self, symbol: str):
+        return symbol.upper() in self._rows
+
+    def symbols(self):
+        return list(self._rows)
+
+    def get(self, symbol: str):
+        """
+        Возвращает тикер в формате Bybit или None, если символа нет или таблица устарела.
+
+        :return: Словарь с полями symbol, lastPrice, highPrice24h, lowPrice24h.
+        """
+        row = self._rows.get(symbol.upper())
+        if row is None or not self.is_fresh():
+            record_cache("bybit_spot_table", False)
+            return None
+        record_cache("bybit_spot_table", True)
+        return {
+            'symbol': symbol.upper(),
+            'lastPrice': _format_price(self._last[row]),
+            'highPrice24h': _format_price(self._high[row]),
+            'lowPrice24h': _format_price(self._low[row]),
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing Bybit ticker table: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """
+        Запускает обновление по расписанию (вызывается при запуске диспетчера).
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает обновление (вызывается при остановке диспетчера).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def _format_price(value: float):
+    """
+    Форматирует цену без экспоненты и лишних нулей (0.00001234, 65000.1).
+    """
+    return np.format_float_positional(value, trim='-')
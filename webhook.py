@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import os
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, path: str, secret_token: str = None):
+    """
+    Создает aiohttp-приложение, которое принимает обновления Telegram через вебхук.
+
+    :param dp: Диспетчер aiogram.
+    :param bot: Экземпляр бота.
+    :param path: Путь, по которому Telegram отправляет обновления.
+    :param secret_token: Секрет для проверки заголовка X-Telegram-Bot-Api-Secret-Token.
+    :return: Приложение aiohttp.
+    """
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token).register(app, path=path)
+    # Связываем запуск и остановку диспетчера с жизненным циклом приложения
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """
+    Запускает бота в режиме вебхука. Настройки берутся из .env:
+
+    WEBHOOK_BASE_URL - внешний адрес (например, https://bot.example.com); если пуст,
+                       вебхук в Telegram не регистрируется (удобно для локальных тестов);
+    WEBHOOK_PATH - путь для обновлений (по умолчанию /webhook);
+    WEBHOOK_SECRET - секрет для проверки запросов от Telegram (обязателен, если задан
+                     WEBHOOK_BASE_URL: без него сервер принял бы любой POST как обновление);
+    WEBHOOK_SET_ON_STARTUP - регистрировать ли вебхук при запуске (1/0), чтобы
+                             за балансировщиком это делала только одна реплика;
+    WEBAPP_HOST, WEBAPP_PORT - адрес, на котором слушает веб-сервер.
+    """
+    base_url = os.getenv('WEBHOOK_BASE_URL', '').rstrip('/')
+    path = os.getenv('WEBHOOK_PATH', '/webhook')
+    secret_token = os.getenv('WEBHOOK_SECRET') or None
+    host = os.getenv('WEBAPP_HOST', '0.0.0.0')
+    port = int(os.getenv('WEBAPP_PORT', '8080'))
+
+    if base_url and secret_token is None:
+        raise RuntimeError("WEBHOOK_SECRET must be set when WEBHOOK_BASE_URL is set")
+
+    if base_url and os.getenv('WEBHOOK_SET_ON_STARTUP', '1') == '1':
+        await bot.set_webhook(f"{base_url}{path}", secret_token=secret_token, drop_pending_updates=True)
+
+    app = create_webhook_app(dp, bot, path, secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"Webhook server started on {host}:{port}{path}")
+
+    try:
+        # Работаем, пока процесс не остановят
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()